@@ -0,0 +1,29 @@
+"""
+Options of the benchmarks (my_weather_plugin/tests/test_benchmark.py). They are registered here, in the root
+conftest, because pytest only reads the options of the conftest files it loads before collecting.
+"""
+import pytest
+
+# Dataset sizes (rows) benchmarked by default with --benchmark, override with --benchmark-rows
+BENCHMARK_ROWS = [10_000, 100_000, 1_000_000]
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true', help='run the benchmarks in tests/test_benchmark.py')
+    parser.addoption('--benchmark-rows', type=int, nargs='+', default=BENCHMARK_ROWS,
+                     help='synthetic dataset sizes to benchmark (10k to 10M rows)')
+    parser.addoption('--benchmark-requests', type=int, default=100, help='requests per endpoint and dataset')
+    parser.addoption('--benchmark-output', default='benchmark_results.json', help='where the results are written')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: slow measurement, only run with --benchmark')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark'):
+        return
+    skip = pytest.mark.skip(reason='benchmarks only run with --benchmark')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
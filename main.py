@@ -1,14 +1,36 @@
+import argparse
+import atexit
+import json
 import os
 from datetime import datetime, timedelta
-from flask import Flask, jsonify, request
-from flask_bootstrap import Bootstrap
+from functools import partial
+
+import numpy as np
+from flask import Flask, g, jsonify, request, Response
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from waitress import serve
-from flask_compress import Compress
 
-from my_weather_plugin.helpers import handle_request_errors, parse_date, get_transformed_data_frames, get_nearst_values_to_now, \
-    get_difference_of_hour_between_two_dates, check_threshold
-from my_weather_plugin.weather_forecast import WEATHER_FORECAST_MODEL
+from my_weather_plugin.helpers import handle_request_errors, parse_date, get_nearst_values_to_now, \
+    get_difference_of_hour_between_two_dates, check_threshold, get_nearst_values_to_many, get_nearst_observation_times, \
+    is_admin_request
+from my_weather_plugin.evaluation import evaluate_lag
+from my_weather_plugin.response_cache import ResponseCache
+from my_weather_plugin.offload import ComputeOffloader, forecast_in_worker, evaluate_in_worker
+from my_weather_plugin.sites import Site, SiteRegistry, discover_sites, default_site_config
+from my_weather_plugin.logs import configure_logging
+from my_weather_plugin.backtest import iter_backtest, horizon_result_to_dict
+from my_weather_plugin.streaming import negotiate_format, stream_table, stream_response, NDJSON, NPY, ARROW
+from my_weather_plugin.metrics import metrics, timed, profiles
+from my_weather_plugin.consts import WARM_UP_MODELS, WAITRESS_THREADS, path_url, BATCH_MAX_PAIRS, \
+    MAX_FORECAST_HORIZON, feature_variables, target_variables, MODEL_ARTIFACTS_DIR, ARTIFACTS_DIR, USE_BOOTSTRAP, \
+    DATA_REFRESH_INTERVAL, WORKERS, OFFLOAD_WORKERS, BACKTEST_STEP, BACKTEST_MIN_TRAINING, \
+    STREAM_CHUNK_ROWS, FORECAST_RANGE_MAX_HOURS, DEFAULT_SITE, SITES_DIR, SITES_MEMORY_BUDGET_MB
+
+# Columns of the streamed forecast and backtest tables (see streaming.py)
+FORECAST_SCHEMA = [('now', 'datetime64[ns]'), ('then', 'datetime64[ns]'),
+                   *((variable, 'float64') for variable in target_variables)]
+BACKTEST_SCHEMA = [('origin', 'datetime64[ns]'), ('horizon', 'int32'), ('variable', 'U16'), ('rmse', 'float64'),
+                   ('mae', 'float64'), ('count', 'int64')]
 
 
 def prepare_data_for_prediction(now: datetime, target_time: datetime):
@@ -16,23 +38,84 @@ def prepare_data_for_prediction(now: datetime, target_time: datetime):
     return round(horizon_hours)
 
 
-def create_app():
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, recording the serialization of every jsonify response as a metrics stage."""
+    def response(self, *args, **kwargs):
+        with timed('json_serialization'):
+            return super().response(*args, **kwargs)
+
+
+def create_app(warm_up_models: bool = WARM_UP_MODELS, data_path: str = path_url,
+               artifacts_dir: str = MODEL_ARTIFACTS_DIR, refresh_interval: float = DATA_REFRESH_INTERVAL,
+               response_cache: ResponseCache = None, offload_workers: int = OFFLOAD_WORKERS,
+               sites_dir: str = SITES_DIR, sites_memory_budget_mb: float = SITES_MEMORY_BUDGET_MB,
+               artifacts_root: str = ARTIFACTS_DIR):
+    logger = configure_logging()
     start_date = datetime.today().strftime('%d-%m-%Y %H:%M:%S')
-    temperature, irradiance, wind_speed = get_transformed_data_frames()
-    forecasting_model = WEATHER_FORECAST_MODEL()
+    # The default site (data_path) is loaded up front and never unloaded, the others on their first request
+    default_site = default_site_config(data_path, artifacts_dir, artifacts_root)
+    data_store = default_site.create_store()
+    response_cache = response_cache if response_cache is not None else ResponseCache()
+    sites = SiteRegistry(discover_sites(sites_dir, data_path, artifacts_dir, artifacts_root), sites_memory_budget_mb,
+                         response_cache, refresh_interval, warm_up_models)
+    sites.add(Site(default_site, data_store, response_cache))
+    offloader = ComputeOffloader(offload_workers, site=default_site) if offload_workers else None
+    if offloader is not None:
+        atexit.register(offloader.shutdown)
+    if warm_up_models:
+        data_store.forecasting_model.warm_up()
+    if refresh_interval:
+        data_store.watch(refresh_interval)
     app = Flask(__name__, instance_relative_config=True)
     app.config['JSON_SORT_KEYS'] = False
-    print('start_server')
+    app.extensions['data_store'] = data_store
+    app.extensions['forecasting_model'] = data_store.forecasting_model
+    app.extensions['response_cache'] = response_cache
+    app.extensions['sites'] = sites
+    app.extensions['offloader'] = offloader
+    app.json = TimedJSONProvider(app)
+    logger.info('start_server')
+    from flask_compress import Compress
     compress = Compress()
     compress.init_app(app)
 
     CORS(app)
-    Bootstrap(app)
+    if USE_BOOTSTRAP:
+        # Only needed to render Bootstrap templates, the API itself serves JSON
+        from flask_bootstrap import Bootstrap
+        Bootstrap(app)
     try:
         os.makedirs(app.instance_path)
     except OSError:
         pass
 
+    def current_site() -> Site:
+        """The site named by the request's 'site' parameter (the default one when omitted), loaded if needed."""
+        name = request.args.get('site', DEFAULT_SITE)
+        g.site = name if name in sites else 'unknown'
+        return sites.get(name)
+
+    async def get_cached_forecast(site: Site, now, lag=24):
+        """
+        Forecast of the site from 'now' with this lag, through its response cache. The key holds the observations
+        'now' resolves to rather than 'now' itself, so every request resolving to the same hour's data shares it.
+        On a miss the forecast is computed in the offload pool when there is one.
+        """
+        data_store, response_cache = site.data_store, site.response_cache
+        sensor_indexes = data_store.sensor_indexes
+        data_version = data_store.data_version
+        cache_key = response_cache.make_key('forecast', site.name, data_version, lag,
+                                            *get_nearst_observation_times(*sensor_indexes, now))
+        forecast = response_cache.get(cache_key)
+        if forecast is None:
+            if offloader is None:
+                forecast = data_store.forecasting_model.forecast_model(
+                    now, get_nearst_values_to_now(*sensor_indexes, now), lag)
+            else:
+                forecast = await offloader.run(cache_key, forecast_in_worker, site.config, now, lag, data_version)
+            response_cache.set(cache_key, forecast)
+        return forecast
+
     @app.errorhandler(404)
     def page_not_found(error):
         """ Return a custom message for Page Not Found (404) errors. """
@@ -41,17 +124,59 @@ def create_app():
     @app.route('/', methods=['GET'], endpoint='status')
     @handle_request_errors
     def hello():
-        """ Return server status and current time. """
+        """ Return server status and current time, with the caches of the site and the state of the site pool. """
+        site = current_site()
         now = datetime.today().strftime('%d-%m-%Y %H:%M:%S')
-        return jsonify({'last_server_update': start_date, 'date_now': now, 'status': 200})
+        return jsonify({'last_server_update': start_date, 'date_now': now, 'status': 200, 'site': site.name,
+                        'model_cache': site.data_store.forecasting_model.fitted_models.stats(),
+                        'response_cache': site.response_cache.stats(),
+                        'sites': sites.stats(),
+                        'offload': offloader.stats() if offloader is not None else None})
+
+    @app.route('/metrics', methods=['GET'], endpoint='metrics')
+    def get_metrics():
+        """
+        Request and stage duration histograms and request counters of this process, plus the cache gauges and
+        estimated memory of every loaded site, in the Prometheus text format.
+        """
+        loaded = sites.loaded()
+        model_caches = {site.name: site.data_store.forecasting_model.fitted_models.stats() for site in loaded}
+
+        def per_site(value):
+            return [({'site': site.name}, value(site)) for site in loaded]
+
+        collected = {
+            'weather_model_cache_size': ('gauge', 'Fitted models in the model cache',
+                                         per_site(lambda site: model_caches[site.name]['size'])),
+            'weather_model_cache_hits_total': ('counter', 'Model cache hits',
+                                               per_site(lambda site: model_caches[site.name]['hits'])),
+            'weather_model_cache_misses_total': ('counter', 'Model cache misses',
+                                                 per_site(lambda site: model_caches[site.name]['misses'])),
+            'weather_response_cache_hits_total': ('counter', 'Response cache hits',
+                                                  per_site(lambda site: site.response_cache.hits)),
+            'weather_response_cache_misses_total': ('counter', 'Response cache misses',
+                                                    per_site(lambda site: site.response_cache.misses)),
+            'weather_site_memory_bytes': ('gauge', 'Estimated memory of a loaded site', per_site(Site.memory_usage)),
+            'weather_sites_memory_budget_bytes': ('gauge', 'Memory budget of the loaded sites', sites.memory_budget),
+        }
+        return Response(metrics.render(collected), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/metrics/profiles/<profile_id>', methods=['GET'], endpoint='profile')
+    def get_profile(profile_id):
+        """ Collapsed stacks sampled during a request sent with X-Profile: 1, as named by its X-Profile-Id. """
+        profile = profiles.get(profile_id)
+        if profile is None:
+            return jsonify({'error': 'Unknown profile'}), 404
+        return Response(profile, mimetype='text/plain')
 
     @app.route('/forecasts', methods=['GET'], endpoint='forecasts')
     @handle_request_errors
-    def get_forecasts():
+    async def get_forecasts():
         """
         Handle GET requests to fetch weather forecasts between 'now' and 'then'.
         nown and received passed on the query params should receive a datetime string
         """
+        site = current_site()
         now = request.args.get('now')
         then = request.args.get('then')
 
@@ -68,19 +193,122 @@ def create_app():
             hours=48), "'then' value should be between 'now' value and 'now' + 48 hours"
         # todo now value validation (check if value in our data range)
 
-        calculation_mesures = get_nearst_values_to_now(temperature, irradiance, wind_speed, now)
         lag = get_difference_of_hour_between_two_dates(now, then)
-        forecasting_result = forecasting_model.forecast_model(now, calculation_mesures, lag)
+        forecasting_result = await get_cached_forecast(site, now, lag)
+
+        return jsonify(forecasting_result)
+
+    @app.route('/forecasts/batch', methods=['POST'], endpoint='forecasts_batch')
+    @handle_request_errors
+    def post_forecasts_batch():
+        """
+        Handle POST requests to fetch weather forecasts for many 'now'/'then' pairs in one call.
+        The JSON body is {"pairs": [{"now": datetime string, "then": datetime string}, ...]} (or just the list),
+        results are returned in the same order as the pairs.
+        """
+        data_store = current_site().data_store
+        payload = request.get_json(silent=True)
+        pairs = payload.get('pairs') if isinstance(payload, dict) else payload
+
+        if not pairs or not isinstance(pairs, list):
+            return jsonify({'error': 'Missing required parameters'}), 400
+        if len(pairs) > BATCH_MAX_PAIRS:
+            return jsonify({'error': f'At most {BATCH_MAX_PAIRS} pairs can be forecasted per request'}), 400
+
+        try:
+            nows = [parse_date(date=pair['now']) for pair in pairs]
+            thens = [parse_date(date=pair['then']) for pair in pairs]
+        except:
+            return jsonify({'error': 'Invalid date format, please use YYYY-MM-DD HH:MM:SS'}), 400
+
+        if not all(now <= then <= now + timedelta(hours=MAX_FORECAST_HORIZON) for now, then in zip(nows, thens)):
+            return jsonify({'error': "'then' value should be between 'now' value and 'now' + 48 hours"}), 400
+
+        calculation_mesures = get_nearst_values_to_many(*data_store.sensor_indexes, nows)
+        features = np.column_stack([calculation_mesures[variable] for variable in feature_variables])
+        lags = [get_difference_of_hour_between_two_dates(now, then) for now, then in zip(nows, thens)]
+        forecasting_result = data_store.forecasting_model.forecast_batch(features, lags)
+
+        return jsonify({'forecasts': [
+            {'now': pair['now'], 'then': pair['then'],
+             **{variable: float(forecasting_result[variable][position]) for variable in target_variables}}
+            for position, pair in enumerate(pairs)
+        ]})
+
+    @app.route('/forecasts/curve', methods=['GET'], endpoint='forecasts_curve')
+    @handle_request_errors
+    def get_forecasts_curve():
+        """
+        Handle GET requests to fetch the whole forecast trajectory from 'now' to 'now' + 48 hours, hour by hour.
+        now passed on the query params should receive a datetime string
+        """
+        data_store = current_site().data_store
+        now = request.args.get('now')
+
+        if not now:
+            return jsonify({'error': 'Missing required parameters'}), 400
+
+        try:
+            now = parse_date(date=now)
+        except:
+            return jsonify({'error': 'Invalid date format, please use YYYY-MM-DD HH:MM:SS'}), 400
+
+        calculation_mesures = get_nearst_values_to_now(*data_store.sensor_indexes, now)
+        forecasting_result = data_store.forecasting_model.forecast_curve(now, calculation_mesures)
 
+        mimetype = negotiate_format(['application/json', NDJSON, NPY, ARROW])
+        if mimetype != 'application/json':
+            timestamps = np.array(forecasting_result.pop('timestamps'), dtype='datetime64[ns]')
+            return stream_table(FORECAST_SCHEMA, [{
+                'now': np.full(len(timestamps), np.datetime64(now, 'ns')), 'then': timestamps,
+                **{variable: np.asarray(values) for variable, values in forecasting_result.items()}}], mimetype)
         return jsonify(forecasting_result)
 
+    @app.route('/forecasts/range', methods=['GET'], endpoint='forecasts_range')
+    @handle_request_errors
+    def get_forecasts_range():
+        """
+        Stream the forecasts made from every hour between 'start' and 'end' (datetime strings) with the horizon
+        'lag' (hours, default 24), as NDJSON rows or in the binary format the Accept header asks for.
+        Rows are computed, serialized and compressed STREAM_CHUNK_ROWS at a time, so any range fits in memory,
+        and a range spans at most FORECAST_RANGE_MAX_HOURS hours, so no request holds a thread for too long.
+        """
+        data_store = current_site().data_store
+        try:
+            start, end = parse_date(date=request.args['start']), parse_date(date=request.args['end'])
+            lag = int(request.args.get('lag', 24))
+        except KeyError:
+            return jsonify({'error': 'Missing required parameters'}), 400
+        except ValueError:
+            return jsonify({'error': 'Invalid parameters, dates should be YYYY-MM-DD HH:MM:SS and lag an integer'}), 400
+        if end < start or not 1 <= lag <= MAX_FORECAST_HORIZON:
+            return jsonify({'error': f"'end' should not be before 'start', "
+                                     f"and 'lag' should be within 1..{MAX_FORECAST_HORIZON}"}), 400
+
+        hour = np.timedelta64(1, 'h')
+        first_now = np.datetime64(start, 'ns')
+        hours = int((np.datetime64(end, 'ns') - first_now) // hour) + 1
+        if hours > FORECAST_RANGE_MAX_HOURS:
+            return jsonify({'error': f'The range should span at most {FORECAST_RANGE_MAX_HOURS} hours'}), 400
+        sensor_indexes, forecasting_model = data_store.sensor_indexes, data_store.forecasting_model
+
+        def chunks():
+            for chunk_start in range(0, hours, STREAM_CHUNK_ROWS):
+                nows = first_now + np.arange(chunk_start, min(chunk_start + STREAM_CHUNK_ROWS, hours)) * hour
+                calculation_mesures = get_nearst_values_to_many(*sensor_indexes, nows)
+                features = np.column_stack([calculation_mesures[variable] for variable in feature_variables])
+                forecasts = forecasting_model.forecast_batch(features, np.full(len(nows), lag))
+                yield {'now': nows, 'then': nows + lag * hour, **forecasts}
+
+        return stream_table(FORECAST_SCHEMA, chunks(), negotiate_format([NDJSON, NPY, ARROW]))
+
     @app.route('/tomorrow', methods=['GET'], endpoint='tomorrow')
     @handle_request_errors
-    def get_tomorrow():
+    async def get_tomorrow():
         """
         Provide a weather forecast for the next day based on the 'now' query parameter should receive a datetime string.
         """
-
+        site = current_site()
         now = request.args.get('now')
         try:
             now = parse_date(date=now)
@@ -89,19 +317,20 @@ def create_app():
 
         # todo now value validation (check if value in our data range)
 
-        calculation_mesures = get_nearst_values_to_now(temperature, irradiance, wind_speed, now)
-        forecasted_result = forecasting_model.forecast_model(now, calculation_mesures)
+        forecasted_result = await get_cached_forecast(site, now)
 
         return jsonify(check_threshold(forecasted_result))
 
     @app.route('/forecast_rmse_precision', methods=['GET'], endpoint='forecast_rmse_precision')
     @handle_request_errors
-    def get_forecast_rmse_precision():
+    async def get_forecast_rmse_precision():
         """
         Handle GET requests to fetch weather forecast precision for a given number of 'lag' hours represent forecasting
         horizon.
         it takes lag an integer as a variable
         """
+        site = current_site()
+        data_store = site.data_store
         lag = request.args.get('lag')
 
         if not lag:
@@ -115,12 +344,81 @@ def create_app():
         assert isinstance(lag, int), "'lag' value should be an integer"
         # todo now value validation (check if value in our data range)
 
-        rmse_values, percentage_accuracy = forecasting_model.evaluate_models(lag)
+        evaluation_table, data_version = data_store.evaluation_table, data_store.data_version
+        if offloader is not None and lag not in evaluation_table:
+            evaluation_table.put(lag, await offloader.run(
+                ('evaluate', site.name, data_version, lag), evaluate_in_worker, site.config, lag, data_version))
+        evaluation = evaluation_table.get(lag, lambda lag: evaluate_lag(data_store.forecasting_model, lag))
+
+        return jsonify(evaluation)
+
+    @app.route('/backtest', methods=['GET'], endpoint='backtest')
+    @handle_request_errors
+    def get_backtest():
+        """
+        Stream a rolling-origin backtest as NDJSON, one line of per-origin RMSE/MAE per horizon and variable,
+        sent as soon as it is computed.
+        Optional query params: 'horizons' (comma separated, default 1..48), 'variables' (comma separated),
+        'step' (hours between origins), 'window' (sliding window in hours, expanding when omitted)
+        and 'min_training' (hours before the first origin).
+        """
+        data_store = current_site().data_store
+        try:
+            horizons = [int(horizon) for horizon in request.args.get('horizons', '').split(',') if horizon] \
+                or list(range(1, MAX_FORECAST_HORIZON + 1))
+            variables = [variable for variable in request.args.get('variables', '').split(',') if variable] \
+                or list(target_variables)
+            step = int(request.args.get('step', BACKTEST_STEP))
+            window = int(request.args['window']) if request.args.get('window') else None
+            min_training = int(request.args.get('min_training', BACKTEST_MIN_TRAINING))
+        except ValueError:
+            return jsonify({'error': "'horizons', 'step', 'window' and 'min_training' should be integers"}), 400
+        if not all(1 <= horizon <= MAX_FORECAST_HORIZON for horizon in horizons) \
+                or not set(variables) <= set(target_variables) or step < 1 or (window is not None and window < 1):
+            return jsonify({'error': f'horizons should be within 1..{MAX_FORECAST_HORIZON}, variables within '
+                                     f'{target_variables}, step and window positive'}), 400
+
+        results = iter_backtest(horizons, variables, step, window, min_training,
+                                forecasting_model=data_store.forecasting_model)
+        mimetype = negotiate_format([NDJSON, NPY, ARROW])
+        if mimetype == NDJSON:
+            return stream_response(
+                ((json.dumps(horizon_result_to_dict(result)) + '\n').encode() for result in results), NDJSON)
+        return stream_table(BACKTEST_SCHEMA, ({
+            'origin': result['origins'].view('datetime64[ns]'),
+            'horizon': np.full(len(result['origins']), result['horizon']),
+            'variable': np.full(len(result['origins']), result['variable']),
+            'rmse': result['rmse'], 'mae': result['mae'], 'count': result['counts'],
+        } for result in results), mimetype)
+
+    @app.route('/admin/refresh', methods=['POST'], endpoint='admin_refresh')
+    @handle_request_errors
+    def post_admin_refresh():
+        """
+        Ingest the beliefs appended to the data file since the last read, without restarting the server.
+        Disabled unless ADMIN_TOKEN is set, the X-Admin-Token header should then carry it.
+        """
+        if not is_admin_request():
+            return jsonify({'error': 'Invalid admin token'}), 403
 
-        return jsonify({'rmse_values': rmse_values, 'percentage_accuracy': percentage_accuracy})
+        return jsonify(current_site().data_store.refresh())
 
     return app
 
 
 if __name__ == "__main__":
-    serve(create_app(), host="0.0.0.0", port=5000)
+    parser = argparse.ArgumentParser(description='Serve the weather forecast API')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=WORKERS, help='number of pre-forked worker processes')
+    parser.add_argument('--threads', type=int, default=WAITRESS_THREADS, help='waitress threads per worker')
+    parser.add_argument('--data', default=path_url, help='belief CSV of the default site')
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        from my_weather_plugin.serving import serve_prefork
+        serve_prefork(partial(create_app, data_path=args.data), args.workers, host=args.host, port=args.port,
+                      threads=args.threads, data_path=args.data)
+    else:
+        from waitress import serve
+        serve(create_app(data_path=args.data), host=args.host, port=args.port, threads=args.threads)
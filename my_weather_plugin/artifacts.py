@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from my_weather_plugin.consts import path_url, target_variables, feature_variables, WARM_UP_LAGS, \
+    MODEL_ARTIFACTS_VERSION, MODEL_ARTIFACTS_DIR
+from my_weather_plugin.evaluation import dataset_fingerprint
+from my_weather_plugin.forecasting import ParameterForecaster, LazyForecastModel
+from my_weather_plugin.helpers import NearestValueIndex
+from my_weather_plugin.metrics import timed
+from my_weather_plugin.model_cache import FittedModelCache
+
+# Sensor indexes stored next to the parameters, in the order get_nearst_values_to_now expects them
+ARTIFACT_SENSORS = ['temperature', 'irradiance', 'wind_speed']
+
+
+def _data_stat(data_path: str):
+    stat = os.stat(data_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def build_model_artifacts(data_path: str = path_url, directory: str = MODEL_ARTIFACTS_DIR, lags=WARM_UP_LAGS) -> str:
+    """
+    Fit every per-lag, per-variable model on the dataset and store only what serving needs:
+    a (lags x target variables x features) parameter array, the sorted sensor arrays used for
+    nearest-observation lookups, and the metadata needed to tell whether they are stale.
+    """
+    from my_weather_plugin.helpers import read_weather_data, get_transformed_data_frames
+    from my_weather_plugin.weather_forecast import WEATHER_FORECAST_MODEL
+
+    weather_data = read_weather_data(path=data_path)
+    sensor_indexes = [NearestValueIndex(table) for table in get_transformed_data_frames(weather_data=weather_data)]
+    forecasting_model = WEATHER_FORECAST_MODEL(weather_data=weather_data)
+    parameters = np.stack([forecasting_model.get_lag_parameters(lag) for lag in lags])
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, 'parameters.npy'), parameters)
+    for sensor, index in zip(ARTIFACT_SENSORS, sensor_indexes):
+        np.save(os.path.join(directory, f'{sensor}_times.npy'), index.times)
+        np.save(os.path.join(directory, f'{sensor}_values.npy'), index.values)
+        np.save(os.path.join(directory, f'{sensor}_positions.npy'), index.positions)
+
+    data_size, data_mtime_ns = _data_stat(data_path)
+    with open(os.path.join(directory, 'metadata.json'), 'w') as file:
+        json.dump({
+            'version': MODEL_ARTIFACTS_VERSION,
+            'fingerprint': dataset_fingerprint(data_path),
+            'data_size': data_size,
+            'data_mtime_ns': data_mtime_ns,
+            'lags': list(lags),
+            'target_variables': target_variables,
+            'feature_variables': feature_variables,
+        }, file)
+    return directory
+
+
+class ModelArtifacts:
+    """
+    Memory-mapped model artifacts written by build_model_artifacts.
+    """
+    def __init__(self, directory: str, metadata: dict):
+        self.directory = directory
+        self.metadata = metadata
+        self.fingerprint = metadata['fingerprint']
+        self.lag_positions = {lag: position for position, lag in enumerate(metadata['lags'])}
+        self.parameters = np.load(os.path.join(directory, 'parameters.npy'), mmap_mode='r')
+
+    @classmethod
+    def load(cls, data_path: str = path_url, directory: str = MODEL_ARTIFACTS_DIR):
+        """
+        Load the artifacts, or return None when they are missing, of another version or layout, or stale.
+        They are stale when the dataset exists and its content hash differs from the one they were built on
+        (the hash is only computed when the file size or modification time changed).
+        """
+        try:
+            with open(os.path.join(directory, 'metadata.json')) as file:
+                metadata = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if metadata.get('version') != MODEL_ARTIFACTS_VERSION \
+                or metadata.get('target_variables') != target_variables \
+                or metadata.get('feature_variables') != feature_variables:
+            return None
+        if os.path.exists(data_path) \
+                and _data_stat(data_path) != (metadata['data_size'], metadata['data_mtime_ns']) \
+                and dataset_fingerprint(data_path) != metadata['fingerprint']:
+            return None
+        try:
+            return cls(directory, metadata)
+        except OSError:
+            return None
+
+    def sensor_indexes(self) -> [NearestValueIndex]:
+        """Return the memory-mapped nearest-observation index of each sensor."""
+        def load(sensor, array):
+            return np.load(os.path.join(self.directory, f'{sensor}_{array}.npy'), mmap_mode='r')
+
+        return [NearestValueIndex.from_arrays(load(sensor, 'times'), load(sensor, 'values'), load(sensor, 'positions'))
+                for sensor in ARTIFACT_SENSORS]
+
+
+class ArtifactForecastModel(ParameterForecaster):
+    """
+    Forecasting model served from precomputed parameters, so no statsmodels import nor CSV read is needed.
+    Anything the artifacts do not cover (other lags, evaluations) goes to a trained model created on first use.
+    """
+    def __init__(self, artifacts: ModelArtifacts, fallback_factory):
+        self.artifacts = artifacts
+        self.data_version = 1
+        self.fallback_model = LazyForecastModel(fallback_factory)
+
+    @property
+    def fitted_models(self) -> FittedModelCache:
+        return self.fallback_model.fitted_models
+
+    def get_lag_parameters(self, lag=24) -> np.ndarray:
+        position = self.artifacts.lag_positions.get(lag)
+        if position is None:
+            return self.fallback_model.get_lag_parameters(lag)
+        return self.artifacts.parameters[position]
+
+    def forecast_model(self, now, calculation_mesures, lag=24):
+        """
+        Generate a forecast for specified weather variables from the stored coefficients and current conditions.
+        """
+        features = np.array([calculation_mesures[variable] for variable in feature_variables], dtype=float)
+        parameters = self.get_lag_parameters(lag)
+        with timed('forecast'):
+            forecasts = parameters @ features
+        return {target_variable: float(forecasts[position]) for position, target_variable in enumerate(target_variables)}
+
+    def evaluate_models(self, lag):
+        return self.fallback_model.evaluate_models(lag)
+
+    def get_regression_frame(self, lag=24, target_variable="temperature"):
+        return self.fallback_model.get_regression_frame(lag, target_variable)
+
+    def warm_up(self, lags=WARM_UP_LAGS):
+        """Artifacts are already fitted, only lags missing from them need training."""
+        for lag in lags:
+            self.get_lag_parameters(lag)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit every per-lag model and store its parameters for fast cold start')
+    parser.add_argument('--data', default=path_url, help='belief CSV to fit the models on')
+    parser.add_argument('--output', default=MODEL_ARTIFACTS_DIR, help='directory to write the model artifacts to')
+    args = parser.parse_args()
+
+    print(f'Model artifacts written to {build_model_artifacts(args.data, args.output)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Rolling-origin backtest: forecast accuracy as a function of forecast origin and horizon.
+
+    python -m my_weather_plugin.backtest --horizons 1 6 24 48 --step 24 --window 720 --output backtest.json
+
+The forecast origin walks through the data every `step` hours. At each origin a model per horizon and variable
+is fitted on the rows whose outcome was known by then, either all of them (expanding window) or those of the
+last `window` hours (sliding window). It then forecasts from every time up to the next origin. Fits are
+incremental: moving to the next origin adds (and for a sliding window removes) rows with
+RecursiveLeastSquares, so nothing is refitted from scratch. Horizons and variables run in parallel
+processes. The result is an origin x horizon x variable matrix of RMSE and MAE.
+"""
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from my_weather_plugin.consts import path_url, target_variables, MAX_FORECAST_HORIZON, BACKTEST_STEP, \
+    BACKTEST_MIN_TRAINING
+from my_weather_plugin.online import RecursiveLeastSquares
+
+HOUR = 3600 * 10 ** 9
+
+_worker_model = None
+
+
+def origin_grid(first_time: int, last_time: int, step: int, min_training: int) -> np.ndarray:
+    """
+    Origins (UTC epoch ns) every step hours, aligned on multiples of step since the epoch so that the grids of
+    every horizon line up, from min_training hours after first_time to last_time.
+    """
+    step_ns = step * HOUR
+    first_origin = -(-(first_time + min_training * HOUR) // step_ns) * step_ns
+    return np.arange(first_origin, last_time + 1, step_ns, dtype=np.int64)
+
+
+def walk_origins(times: np.ndarray, x: np.ndarray, y: np.ndarray, lag: int, origins: np.ndarray, step: int,
+                 window: int = None) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Backtest one horizon and variable on its regression rows (outcome times in UTC epoch ns, features, outcomes).
+    Returns the RMSE, MAE and number of forecasts of each origin (NaN when an origin has none).
+    A row is only used for training once its outcome time is reached, and it is forecast from its issue time
+    (outcome time - lag), by the model of the last origin before it.
+    """
+    estimator = RecursiveLeastSquares(x.shape[1])
+    issue_times = times - lag * HOUR
+    rmse, mae = np.full(len(origins), np.nan), np.full(len(origins), np.nan)
+    counts = np.zeros(len(origins), dtype=np.int64)
+    added = removed = 0
+    for position, origin in enumerate(origins):
+        known = np.searchsorted(times, origin, side='right')
+        estimator.update(x[added:known], y[added:known])
+        added = known
+        if window is not None:
+            expired = np.searchsorted(times, origin - window * HOUR, side='right')
+            estimator.downdate(x[removed:expired], y[removed:expired])
+            removed = expired
+
+        first, last = np.searchsorted(issue_times, [origin, origin + step * HOUR], side='right')
+        errors = estimator.predict(x[first:last]) - y[first:last] if last > first else np.empty(0)
+        errors = errors[~np.isnan(errors)]
+        if len(errors):
+            rmse[position] = np.sqrt(np.mean(errors ** 2))
+            mae[position] = np.mean(np.abs(errors))
+            counts[position] = len(errors)
+    return rmse, mae, counts
+
+
+def backtest_horizon(forecasting_model, lag: int, target_variable: str, step: int = BACKTEST_STEP,
+                     window: int = None, min_training: int = BACKTEST_MIN_TRAINING) -> dict:
+    """Backtest one horizon and variable of the model, on the origin grid of its regression frame."""
+    regression_frame = forecasting_model.get_regression_frame(lag, target_variable)
+    times = regression_frame.index.asi8
+    origins = origin_grid(times[0], times[-1], step, min_training) if len(times) else np.empty(0, dtype=np.int64)
+    rmse, mae, counts = walk_origins(times, regression_frame.iloc[:, 1:].to_numpy(dtype=float),
+                                     regression_frame.iloc[:, 0].to_numpy(dtype=float), lag, origins, step, window)
+    return {'horizon': lag, 'variable': target_variable, 'origins': origins, 'rmse': rmse, 'mae': mae,
+            'counts': counts}
+
+
+def _init_worker(data_path):
+    global _worker_model
+    from my_weather_plugin.helpers import read_weather_data
+    from my_weather_plugin.weather_forecast import WEATHER_FORECAST_MODEL
+
+    _worker_model = WEATHER_FORECAST_MODEL(weather_data=read_weather_data(path=data_path))
+
+
+def _backtest_horizon_in_worker(lag, target_variable, step, window, min_training):
+    return backtest_horizon(_worker_model, lag, target_variable, step, window, min_training)
+
+
+def iter_backtest(horizons=range(1, MAX_FORECAST_HORIZON + 1), variables=tuple(target_variables),
+                  step: int = BACKTEST_STEP, window: int = None, min_training: int = BACKTEST_MIN_TRAINING,
+                  forecasting_model=None, data_path: str = path_url, processes: int = None):
+    """
+    Yield the backtest of every (horizon, variable), see backtest_horizon, as soon as each is done.
+    With a forecasting model they run one after the other in this process. Otherwise they run in a process pool
+    with one model per worker, trained on data_path.
+    """
+    tasks = [(lag, variable) for lag in horizons for variable in variables]
+    if forecasting_model is not None:
+        for lag, variable in tasks:
+            yield backtest_horizon(forecasting_model, lag, variable, step, window, min_training)
+        return
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(data_path,)) as executor:
+        futures = [executor.submit(_backtest_horizon_in_worker, lag, variable, step, window, min_training)
+                   for lag, variable in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def horizon_result_to_dict(result: dict) -> dict:
+    """JSON-ready form of one backtest_horizon result, origins as ISO timestamps and NaN as None."""
+    return {
+        'horizon': result['horizon'],
+        'variable': result['variable'],
+        'origins': format_origins(result['origins']),
+        'rmse': _json_values(result['rmse']),
+        'mae': _json_values(result['mae']),
+        'counts': result['counts'].tolist(),
+    }
+
+
+def _json_values(values: np.ndarray) -> list:
+    return np.where(np.isnan(values), None, np.round(values, 4)).tolist()
+
+
+class BacktestResult:
+    """RMSE and MAE matrices of a backtest, indexed by origin x horizon x variable (NaN where nothing was forecast)."""
+    def __init__(self, origins: np.ndarray, horizons: list, variables: list):
+        self.origins = origins
+        self.horizons = list(horizons)
+        self.variables = list(variables)
+        shape = (len(origins), len(self.horizons), len(self.variables))
+        self.rmse = np.full(shape, np.nan)
+        self.mae = np.full(shape, np.nan)
+
+    @classmethod
+    def collect(cls, results, horizons, variables) -> 'BacktestResult':
+        results = list(results)
+        origins = np.unique(np.concatenate([result['origins'] for result in results])) if results \
+            else np.empty(0, dtype=np.int64)
+        backtest = cls(origins, horizons, variables)
+        for result in results:
+            rows = np.searchsorted(origins, result['origins'])
+            column = backtest.horizons.index(result['horizon'])
+            layer = backtest.variables.index(result['variable'])
+            backtest.rmse[rows, column, layer] = result['rmse']
+            backtest.mae[rows, column, layer] = result['mae']
+        return backtest
+
+    def to_dict(self) -> dict:
+        """JSON-ready form, origins as ISO timestamps and NaN as None."""
+        return {
+            'origins': format_origins(self.origins),
+            'horizons': self.horizons,
+            'variables': self.variables,
+            'rmse': _json_values(self.rmse),
+            'mae': _json_values(self.mae),
+        }
+
+
+def format_origins(origins: np.ndarray) -> list:
+    """Origins (UTC epoch ns) as ISO 8601 strings."""
+    return np.datetime_as_string(np.asarray(origins, dtype=np.int64).view('datetime64[ns]'), unit='s',
+                                 timezone='UTC').tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=path_url, help='belief CSV to backtest on')
+    parser.add_argument('--horizons', type=int, nargs='+', default=list(range(1, MAX_FORECAST_HORIZON + 1)))
+    parser.add_argument('--variables', nargs='+', default=list(target_variables), choices=target_variables)
+    parser.add_argument('--step', type=int, default=BACKTEST_STEP, help='hours between two origins')
+    parser.add_argument('--window', type=int, default=None, help='sliding window in hours (default: expanding)')
+    parser.add_argument('--min-training', type=int, default=BACKTEST_MIN_TRAINING,
+                        help='hours of data before the first origin')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--output', default='backtest.json')
+    args = parser.parse_args()
+
+    results = iter_backtest(args.horizons, args.variables, args.step, args.window, args.min_training,
+                            data_path=args.data, processes=args.processes)
+    backtest = BacktestResult.collect(results, args.horizons, args.variables)
+    with open(args.output, 'w') as file:
+        json.dump(backtest.to_dict(), file)
+    print(f'Backtest of {len(backtest.origins)} origins x {len(backtest.horizons)} horizons '
+          f'x {len(backtest.variables)} variables written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
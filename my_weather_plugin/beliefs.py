@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import numpy as np
+
+from my_weather_plugin.consts import target_variables
+from my_weather_plugin.helpers import to_utc_nanoseconds
+from my_weather_plugin.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+
+def latest_belief_positions(sensor_codes, event_starts, horizons, as_of: int = None) -> np.ndarray:
+    """
+    Row positions of the most recent belief (smallest horizon) about every (sensor, event start),
+    ordered by sensor code then event start. All sensors are handled by one lexsort on
+    (sensor, event_start, horizon) and a comparison of neighbouring rows, without hashing.
+    Rows with the same smallest horizon are resolved in favour of the first one.
+
+    event_starts and as_of are UTC epoch nanoseconds, horizons are seconds. With as_of only the beliefs formed
+    at or before it (event_start - horizon <= as_of) count, i.e. what was known at that time.
+    """
+    sensor_codes = np.asarray(sensor_codes)
+    event_starts = np.asarray(event_starts, dtype=np.int64)
+    horizons = np.asarray(horizons, dtype=np.int64)
+    if as_of is not None:
+        candidates = np.flatnonzero(event_starts - horizons * 10 ** 9 <= as_of)
+        sensor_codes, event_starts, horizons = sensor_codes[candidates], event_starts[candidates], horizons[candidates]
+
+    order = np.lexsort((horizons, event_starts, sensor_codes))
+    sensor_codes, event_starts = sensor_codes[order], event_starts[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (sensor_codes[1:] != sensor_codes[:-1]) | (event_starts[1:] != event_starts[:-1])
+    positions = order[first]
+    return candidates[positions] if as_of is not None else positions
+
+
+def sensor_codes(sensors) -> np.ndarray:
+    """Position of each row's sensor in target_variables (int8), -1 for other sensors."""
+    return pd.Categorical(sensors, categories=target_variables).codes.astype(np.int8)
+
+
+def belief_series(sensor: str, event_starts: np.ndarray, values: np.ndarray, rows: np.ndarray) -> pd.Series:
+    """The values at rows (from latest_belief_positions) as a series indexed by their event start (UTC)."""
+    return pd.Series(
+        np.asarray(values[rows], dtype=float), name=sensor,
+        index=pd.DatetimeIndex(event_starts[rows].view('datetime64[ns]'), name='event_start').tz_localize('UTC'))
+
+
+def latest_beliefs(weather_data: pd.DataFrame, as_of=None, columnar=None) -> dict:
+    """
+    For every sensor of target_variables, the series of its most recent belief per event, indexed by event start
+    (UTC) in ascending order. as_of (a date) restricts the beliefs to those formed at or before it.
+    With a columnar dataset (ColumnarBeliefs) the beliefs are its memory-mapped partitions, plus the rows of
+    weather_data (those appended to the CSV since the conversion).
+    """
+    as_of = None if as_of is None else int(to_utc_nanoseconds(as_of)[0])
+    if columnar is not None:
+        return columnar.latest_beliefs(as_of, appended=weather_data)
+    codes = sensor_codes(weather_data['sensor'])
+    event_starts = pd.DatetimeIndex(weather_data['event_start']).asi8
+    positions = latest_belief_positions(codes, event_starts, weather_data['belief_horizon_in_sec'].to_numpy(),
+                                        as_of=as_of)
+    values = weather_data['event_value'].to_numpy()
+    bounds = np.searchsorted(codes[positions], np.arange(len(target_variables) + 1))
+    return {sensor: belief_series(sensor, event_starts, values, positions[bounds[code]:bounds[code + 1]])
+            for code, sensor in enumerate(target_variables)}
@@ -0,0 +1,168 @@
+"""
+Measure one server process on one dataset: startup time, per-endpoint latency and throughput, and peak RSS.
+
+    python -m my_weather_plugin.benchmark data.csv --requests 200
+
+Or, with --sites-dir, the site pool: every site of the directory requested in turn under a memory budget.
+
+    python -m my_weather_plugin.benchmark data.csv --sites-dir data/sites --memory-budget 64 --rounds 2
+
+Runs in its own interpreter (one per dataset, see tests/test_benchmark.py) so the startup time and peak RSS
+belong to that dataset alone. The measurements are printed as one JSON line.
+"""
+import argparse
+import json
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCHMARK_ENDPOINTS = ('forecasts', 'tomorrow', 'forecast_rmse_precision')
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is in KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def percentiles(latencies: list) -> dict:
+    """p50/p99 of latencies in seconds, in ms."""
+    ordered = sorted(latencies)
+    return {
+        'p50_ms': 1000 * ordered[len(ordered) // 2],
+        'p99_ms': 1000 * ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)],
+    }
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    """Cold (first request) latency, p50/p99 of the following ones and throughput, in ms and requests/s."""
+    return {
+        'requests': len(latencies),
+        'cold_ms': 1000 * latencies[0],
+        **percentiles(latencies[1:] or latencies),
+        'throughput': len(latencies) / elapsed,
+    }
+
+
+def endpoint_urls(endpoint: str, first_event, last_event, requests: int, seed: int = 0) -> list:
+    """Request URLs with random 'now' in the data range and random horizons, the same for every run."""
+    rng = random.Random(seed)
+    hours = max(int((last_event - first_event).total_seconds() // 3600), 1)
+    urls = []
+    for _ in range(requests):
+        now = first_event + timedelta(hours=rng.randrange(hours), minutes=rng.randrange(60))
+        lag = rng.randrange(1, 49)
+        if endpoint == 'forecasts':
+            urls.append(f"/forecasts?now={now:%Y-%m-%d %H:%M:%S}&then={now + timedelta(hours=lag):%Y-%m-%d %H:%M:%S}")
+        elif endpoint == 'tomorrow':
+            urls.append(f'/tomorrow?now={now:%Y-%m-%d %H:%M:%S}')
+        else:
+            urls.append(f'/forecast_rmse_precision?lag={lag}')
+    return urls
+
+
+def measure(data_path: str, requests: int, endpoints=BENCHMARK_ENDPOINTS) -> dict:
+    start = time.perf_counter()
+    from main import create_app
+    from my_weather_plugin.response_cache import ResponseCache, LocalBackend
+
+    # No model artifacts (the CSV path is measured) and no response cache (every request is computed)
+    with tempfile.TemporaryDirectory() as artifacts_dir:
+        app = create_app(warm_up_models=False, data_path=data_path, artifacts_dir=artifacts_dir,
+                         refresh_interval=0, response_cache=ResponseCache(LocalBackend(maxsize=0), ttl=0))
+    startup = time.perf_counter() - start
+    client = app.test_client()
+    weather_data = app.extensions['data_store'].weather_data
+
+    results = {}
+    for endpoint in endpoints:
+        latencies = []
+        endpoint_start = time.perf_counter()
+        for url in endpoint_urls(endpoint, weather_data['event_start'].min(), weather_data['event_start'].max(),
+                                 requests):
+            request_start = time.perf_counter()
+            response = client.get(url)
+            latencies.append(time.perf_counter() - request_start)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} answered {response.status_code}: {response.get_data(as_text=True)}')
+        results[endpoint] = summarize(latencies, time.perf_counter() - endpoint_start)
+
+    return {
+        'rows': len(weather_data),
+        'startup_s': startup,
+        'peak_rss_mb': peak_rss_mb(),
+        'endpoints': results,
+    }
+
+
+def measure_sites(data_path: str, sites_dir: str, memory_budget_mb: float, rounds: int = 2,
+                  now: datetime = None) -> dict:
+    """
+    Request /tomorrow of every site of sites_dir in turn, rounds times, under the memory budget. Reports the
+    most sites and estimated memory loaded at once, loads and evictions, and the latency of the requests that
+    loaded their site (cold) or found it loaded (warm). now defaults to two days ago, within synthetic data.
+    """
+    from main import create_app
+    from my_weather_plugin.consts import DEFAULT_SITE
+    from my_weather_plugin.response_cache import ResponseCache, LocalBackend
+
+    now = now or datetime.utcnow() - timedelta(days=2)
+    with tempfile.TemporaryDirectory() as artifacts_dir:
+        app = create_app(warm_up_models=False, data_path=data_path, artifacts_dir=artifacts_dir,
+                         refresh_interval=0, response_cache=ResponseCache(LocalBackend(maxsize=0), ttl=0),
+                         sites_dir=sites_dir, sites_memory_budget_mb=memory_budget_mb)
+    client = app.test_client()
+    sites = app.extensions['sites']
+    names = [name for name in sites.configs if name != DEFAULT_SITE]
+
+    cold, warm = [], []
+    max_loaded = max_memory = max_site = 0
+    for _ in range(rounds):
+        for name in names:
+            loads = sites.loads
+            request_start = time.perf_counter()
+            response = client.get(f'/tomorrow?site={name}&now={now:%Y-%m-%d %H:%M:%S}')
+            (cold if sites.loads > loads else warm).append(time.perf_counter() - request_start)
+            if response.status_code != 200:
+                raise RuntimeError(f'{name} answered {response.status_code}: {response.get_data(as_text=True)}')
+            loaded = sites.loaded()
+            usage = [site.memory_usage() for site in loaded]
+            max_loaded = max(max_loaded, len(loaded))
+            max_memory = max(max_memory, sum(usage))
+            max_site = max(max_site, *usage)
+
+    return {
+        'sites': len(names),
+        'rounds': rounds,
+        'memory_budget_mb': memory_budget_mb,
+        'max_loaded_sites': max_loaded,
+        'max_sites_memory_mb': max_memory / 2 ** 20,
+        'max_site_memory_mb': max_site / 2 ** 20,
+        'loads': sites.loads,
+        'evictions': sites.evictions,
+        'peak_rss_mb': peak_rss_mb(),
+        'cold': {'requests': len(cold), **percentiles(cold)} if cold else None,
+        'warm': {'requests': len(warm), **percentiles(warm)} if warm else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('data_path')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--endpoints', nargs='+', default=list(BENCHMARK_ENDPOINTS), choices=BENCHMARK_ENDPOINTS)
+    parser.add_argument('--sites-dir', help='measure the site pool on the sites of this directory instead')
+    parser.add_argument('--memory-budget', type=float, default=64, help='site pool memory budget in MB')
+    parser.add_argument('--rounds', type=int, default=2, help='times every site is requested')
+    args = parser.parse_args()
+    if args.sites_dir:
+        print(json.dumps(measure_sites(args.data_path, args.sites_dir, args.memory_budget, args.rounds)))
+    else:
+        print(json.dumps(measure(args.data_path, args.requests, args.endpoints)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Binary columnar layout of the belief dataset, converted once from the CSV and memory-mapped afterwards.
+
+    python -m my_weather_plugin.columnar --data data/weather_forecast.csv --output data/artifacts/columnar
+
+Each sensor is a partition directory holding one .npy file per column: event_start as int64 UTC epoch
+nanoseconds, belief_horizon_in_sec as int32 and event_value as float32. The sensor itself is an int8 code
+(its position in target_variables) kept in the metadata rather than repeated on every row.
+Loading maps the files read-only: nothing is parsed, and the pages are shared by every process mapping them.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from my_weather_plugin.artifacts import _data_stat
+from my_weather_plugin.beliefs import latest_belief_positions, belief_series
+from my_weather_plugin.consts import path_url, target_variables, COLUMNAR_VERSION, COLUMNAR_DIR
+from my_weather_plugin.evaluation import dataset_fingerprint
+from my_weather_plugin.helpers import NearestValueIndex
+from my_weather_plugin.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+COLUMN_DTYPES = {
+    'event_start': np.int64,
+    'belief_horizon_in_sec': np.int32,
+    'event_value': np.float32,
+}
+SENSOR_CODES = {sensor: np.int8(code) for code, sensor in enumerate(target_variables)}
+
+
+def partition_name(sensor: str) -> str:
+    return sensor.replace(' ', '_')
+
+
+def convert_to_columnar(data_path: str = path_url, directory: str = COLUMNAR_DIR) -> str:
+    """Convert the belief CSV to per-sensor column files, with the metadata needed to tell whether they are stale."""
+    from my_weather_plugin.helpers import read_weather_data
+
+    weather_data = read_weather_data(path=data_path)
+    partitions = []
+    for sensor, code in SENSOR_CODES.items():
+        beliefs = weather_data[weather_data['sensor'] == sensor]
+        partition = os.path.join(directory, partition_name(sensor))
+        os.makedirs(partition, exist_ok=True)
+        np.save(os.path.join(partition, 'event_start.npy'), pd.DatetimeIndex(beliefs['event_start']).asi8)
+        for column in ('belief_horizon_in_sec', 'event_value'):
+            np.save(os.path.join(partition, f'{column}.npy'), beliefs[column].to_numpy(dtype=COLUMN_DTYPES[column]))
+        partitions.append({'sensor': sensor, 'code': int(code), 'rows': len(beliefs)})
+
+    data_size, data_mtime_ns = _data_stat(data_path)
+    with open(os.path.join(directory, 'metadata.json'), 'w') as file:
+        json.dump({
+            'version': COLUMNAR_VERSION,
+            'fingerprint': dataset_fingerprint(data_path),
+            'data_size': data_size,
+            'data_mtime_ns': data_mtime_ns,
+            'columns': list(pd.read_csv(data_path, nrows=0).columns),
+            'partitions': partitions,
+        }, file)
+    return directory
+
+
+class BeliefPartition:
+    """The memory-mapped columns of one sensor's beliefs, in CSV row order."""
+    def __init__(self, directory: str, sensor: str, code: int):
+        self.sensor = sensor
+        self.code = np.int8(code)
+        self.columns = {column: np.load(os.path.join(directory, partition_name(sensor), f'{column}.npy'),
+                                        mmap_mode='r')
+                        for column in COLUMN_DTYPES}
+
+    def __len__(self):
+        return len(self.columns['event_start'])
+
+    @property
+    def exact_times(self) -> np.ndarray:
+        """UTC epoch nanoseconds at which each belief was formed (event start minus horizon)."""
+        return self.columns['event_start'] - self.columns['belief_horizon_in_sec'].astype(np.int64) * 10 ** 9
+
+    def frame(self) -> pd.DataFrame:
+        """
+        The partition as a sensor frame of data_split (without the constant sensor column).
+        The horizon and value columns wrap the mapped arrays without copying. event_start is a UTC-aware copy
+        (tz_localize copies, and the frames' consumers compare it to aware dates), and exact_time is computed.
+        """
+        event_start = pd.Series(self.columns['event_start'].view('datetime64[ns]'), copy=False).dt.tz_localize('UTC')
+        return pd.DataFrame({
+            'event_start': event_start,
+            'belief_horizon_in_sec': pd.Series(self.columns['belief_horizon_in_sec'], copy=False),
+            'event_value': pd.Series(self.columns['event_value'], copy=False),
+            'exact_time': pd.Series(self.exact_times.view('datetime64[ns]')).dt.tz_localize('UTC'),
+        }, copy=False)
+
+    def nearest_value_index(self) -> NearestValueIndex:
+        times = self.exact_times
+        order = np.argsort(times, kind='stable')
+        return NearestValueIndex.from_arrays(times[order], np.asarray(self.columns['event_value'])[order], order)
+
+
+class ColumnarBeliefs:
+    """
+    Belief dataset stored by convert_to_columnar, one memory-mapped BeliefPartition per sensor.
+    """
+    def __init__(self, directory: str, metadata: dict):
+        self.directory = directory
+        self.metadata = metadata
+        self.fingerprint = metadata['fingerprint']
+        self.columns = metadata['columns']
+        self.partitions = [BeliefPartition(directory, partition['sensor'], partition['code'])
+                           for partition in metadata['partitions']]
+
+    @classmethod
+    def load(cls, data_path: str = path_url, directory: str = COLUMNAR_DIR):
+        """
+        Map the converted dataset, or return None when it is missing, of another version or sensors, or stale
+        (same rules as ModelArtifacts.load).
+        """
+        try:
+            with open(os.path.join(directory, 'metadata.json')) as file:
+                metadata = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if metadata.get('version') != COLUMNAR_VERSION \
+                or [partition['sensor'] for partition in metadata.get('partitions', [])] != target_variables:
+            return None
+        if os.path.exists(data_path) \
+                and _data_stat(data_path) != (metadata['data_size'], metadata['data_mtime_ns']) \
+                and dataset_fingerprint(data_path) != metadata['fingerprint']:
+            return None
+        try:
+            return cls(directory, metadata)
+        except OSError:
+            return None
+
+    @property
+    def data_size(self) -> int:
+        """Size of the CSV the dataset was converted from, i.e. the offset where appended rows start."""
+        return self.metadata['data_size']
+
+    def sensor_frames(self) -> [pd.DataFrame]:
+        """The temperature, irradiance and wind speed frames, as get_transformed_data_frames returns them."""
+        return [partition.frame() for partition in self.partitions]
+
+    def sensor_indexes(self) -> [NearestValueIndex]:
+        return [partition.nearest_value_index() for partition in self.partitions]
+
+    def appended_frame(self) -> pd.DataFrame:
+        """
+        Empty belief frame in the read_weather_data layout, holding the rows appended to the CSV after the
+        conversion once they are read (the sensor column a categorical of target_variables).
+        """
+        return pd.DataFrame({
+            'event_start': pd.Series([], dtype='datetime64[ns, UTC]'),
+            'belief_horizon_in_sec': pd.Series([], dtype=np.int64),
+            'event_value': pd.Series([], dtype=float),
+            'sensor': pd.Categorical([], categories=target_variables),
+        })
+
+    def latest_beliefs(self, as_of: int = None, appended: pd.DataFrame = None) -> dict:
+        """
+        latest_beliefs of the mapped partitions plus the appended rows (a belief frame), as_of in UTC epoch ns.
+        The mapped columns are deduplicated where they lie, only the appended rows of a sensor (if any) are
+        concatenated to them first.
+        """
+        beliefs = {}
+        for partition in self.partitions:
+            event_starts, horizons, values = (partition.columns[column] for column in COLUMN_DTYPES)
+            rows = appended[appended['sensor'] == partition.sensor] if appended is not None else ()
+            if len(rows):
+                event_starts = np.concatenate([event_starts, pd.DatetimeIndex(rows['event_start']).asi8])
+                horizons = np.concatenate([horizons, rows['belief_horizon_in_sec'].to_numpy(dtype=np.int64)])
+                values = np.concatenate([values, rows['event_value'].to_numpy(dtype=float)])
+            positions = latest_belief_positions(np.broadcast_to(partition.code, len(event_starts)), event_starts,
+                                                horizons, as_of=as_of)
+            beliefs[partition.sensor] = belief_series(partition.sensor, event_starts, values, positions)
+        return beliefs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=path_url, help='belief CSV to convert')
+    parser.add_argument('--output', default=COLUMNAR_DIR, help='directory to write the columnar dataset to')
+    args = parser.parse_args()
+
+    print(f'Columnar dataset written to {convert_to_columnar(args.data, args.output)}')
+
+
+if __name__ == '__main__':
+    main()
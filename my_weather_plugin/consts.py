@@ -1,10 +1,86 @@
+import os
+
 csv_url = 'https://raw.githubusercontent.com/SeitaBV/assignment-data-engineering/refs/heads/main/weather.csv'
 path_url = 'data/weather_forecast.csv'
 # path_url = 'C:\Laevitas\cme_alt\seita-take-home-assignment-data\weather.csv'
 target_variables = ['temperature', 'irradiance', 'wind speed']
+# Order of the current measures fed to the models (see get_nearst_values_to_now)
+feature_variables = ['temperature', 'irradiance', 'wind_speed']
+MAX_FORECAST_HORIZON = 48
+# Share of the modelled time range used for training, the rest is used for testing
+RATIO_TRAINING_TESTING_DATA = 0.80
+
+# Columns (and their dtypes) read from the belief CSV, event_start is parsed separately as a UTC datetime
+CSV_DTYPES = {
+    'belief_horizon_in_sec': 'int64',
+    'event_value': 'float64',
+    'sensor': 'category',
+}
+CSV_COLUMNS = ['event_start', *CSV_DTYPES]
 
 THRESHOLDS = {
     "warm": 20,
     "sunny": 300,
     "windy": 10
 }
+
+# Fitted models are cached per (target variable, lag): 3 variables x lags 0..48
+WARM_UP_LAGS = range(0, 49)
+MODEL_CACHE_SIZE = len(target_variables) * len(WARM_UP_LAGS)
+WARM_UP_MODELS = os.environ.get('WARM_UP_MODELS', '0') == '1'
+WAITRESS_THREADS = int(os.environ.get('WAITRESS_THREADS', '8'))
+BATCH_MAX_PAIRS = 10000
+
+# Precomputed artifacts (evaluation tables, ...) are stored next to the data, keyed by a hash of the dataset
+ARTIFACTS_DIR = os.environ.get('ARTIFACTS_DIR', 'data/artifacts')
+EVALUATION_TABLE_VERSION = 1
+EVALUATION_LAGS = range(1, 49)
+MODEL_ARTIFACTS_VERSION = 1
+MODEL_ARTIFACTS_DIR = os.path.join(ARTIFACTS_DIR, 'models')
+# Belief data converted to memory-mappable per-sensor column files (see columnar.py)
+COLUMNAR_VERSION = 1
+COLUMNAR_DIR = os.path.join(ARTIFACTS_DIR, 'columnar')
+USE_BOOTSTRAP = os.environ.get('USE_BOOTSTRAP', '0') == '1'
+
+# Seconds between checks of the data file for appended beliefs (0 disables the file watch)
+DATA_REFRESH_INTERVAL = float(os.environ.get('DATA_REFRESH_INTERVAL', '0'))
+# Token expected in the X-Admin-Token header by the admin endpoints and for profiling (disabled when unset)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+# 'ols' refits statsmodels OLS models, 'online' keeps recursive least squares models updated with new rows
+MODEL_ESTIMATOR = os.environ.get('MODEL_ESTIMATOR', 'ols')
+
+# Response cache of /forecasts and /tomorrow, shared between workers when RESPONSE_CACHE_URL (redis://...) is set
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '10000'))
+RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL')
+# Number of pre-forked waitress worker processes (1 serves from this process)
+WORKERS = int(os.environ.get('WORKERS', '1'))
+
+# Forecasting work offloaded from async routes to a process pool (0 computes in the request thread)
+OFFLOAD_WORKERS = int(os.environ.get('OFFLOAD_WORKERS', '0'))
+# Distinct computations queued or running in the pool before requests are answered with 503
+OFFLOAD_MAX_PENDING = int(os.environ.get('OFFLOAD_MAX_PENDING', str(4 * max(OFFLOAD_WORKERS, 1))))
+
+# Level of the package's log records (written to stderr by a background thread, see logs.configure_logging)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Seconds between two stack samples of a profiled request (X-Profile: 1), and number of profiles kept
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.001'))
+PROFILES_KEPT = 20
+
+# Rolling-origin backtests: hours between two forecast origins, and training history before the first origin
+BACKTEST_STEP = 24
+BACKTEST_MIN_TRAINING = 7 * 24
+
+# Rows serialized (and compressed) per chunk of a streamed response
+STREAM_CHUNK_ROWS = 1000
+# Most hourly forecasts one /forecasts/range request may ask for (a year)
+FORECAST_RANGE_MAX_HOURS = int(os.environ.get('FORECAST_RANGE_MAX_HOURS', str(366 * 24)))
+STREAM_GZIP_LEVEL = 6
+
+# Sites served besides the default one (path_url): every <site>.csv of SITES_DIR, selected with ?site=<site>
+SITES_DIR = os.environ.get('SITES_DIR', 'data/sites')
+DEFAULT_SITE = 'default'
+# Estimated memory (MB) the loaded sites may hold, the least recently used ones are unloaded past it
+SITES_MEMORY_BUDGET_MB = float(os.environ.get('SITES_MEMORY_BUDGET_MB', '1024'))
+# Sites whose data an offload worker process keeps loaded
+OFFLOAD_WORKER_SITES = 4
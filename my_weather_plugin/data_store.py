@@ -0,0 +1,260 @@
+import csv
+import hashlib
+import io
+import logging
+import mmap
+import os
+import threading
+
+import numpy as np
+
+from my_weather_plugin.artifacts import ModelArtifacts, ArtifactForecastModel
+from my_weather_plugin.columnar import ColumnarBeliefs
+from my_weather_plugin.consts import path_url, target_variables, MODEL_ARTIFACTS_DIR, ARTIFACTS_DIR, COLUMNAR_DIR
+from my_weather_plugin.evaluation import EvaluationTable
+from my_weather_plugin.forecasting import LazyForecastModel
+from my_weather_plugin.helpers import parse_weather_csv, data_transform, data_split, NearestValueIndex, \
+    get_transformed_data_frames
+from my_weather_plugin.lazy import lazy_import
+
+logger = logging.getLogger(__name__)
+
+pd = lazy_import('pandas')
+
+
+def _is_memory_mapped(array) -> bool:
+    """Whether the array's memory is a file mapping (shared page cache, not this process' own memory)."""
+    base = array
+    while isinstance(base, np.ndarray):
+        base = base.base
+    return isinstance(base, mmap.mmap)
+
+
+class WeatherDataStore:
+    """
+    The belief data of one dataset and what is derived from it: the per-sensor nearest-observation indexes,
+    the forecasting model and the evaluation table.
+    New beliefs appended to the CSV are ingested with refresh(), which reads only the bytes added since the
+    last read, instead of a restart that would throw every fitted model away.
+    The beliefs are mapped from the columnar dataset in columnar_dir when it is up to date, the CSV is parsed
+    otherwise.
+    """
+    def __init__(self, data_path: str = path_url, artifacts_dir: str = MODEL_ARTIFACTS_DIR,
+                 evaluation_dir: str = ARTIFACTS_DIR, columnar_dir: str = COLUMNAR_DIR):
+        self.data_path = data_path
+        self.evaluation_dir = evaluation_dir
+        self.columnar_dir = columnar_dir
+        self.weather_data = None
+        self.columnar = None
+        self.columns = None
+        self.offset = 0
+        self._digest = hashlib.sha256()
+        self._lock = threading.RLock()
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+        artifacts = ModelArtifacts.load(data_path, artifacts_dir)
+        if artifacts is not None:
+            # Served from the model artifacts, the CSV is only read once a refresh or a fallback needs it
+            self.sensor_indexes = tuple(artifacts.sensor_indexes())
+            self.forecasting_model = ArtifactForecastModel(artifacts, self._train_model)
+            self.fingerprint = artifacts.fingerprint
+            with open(data_path, newline='') as file:
+                self.columns = next(csv.reader(file))
+            # Rows appended to the CSV after the artifacts were built are read by the next refresh
+            self.offset = artifacts.metadata['data_size']
+            self._digest = None
+        else:
+            self._load_all()
+            self.forecasting_model = LazyForecastModel(self._train_model)
+        self.evaluation_table = EvaluationTable.load(self.data_version, evaluation_dir)
+
+    @property
+    def data_version(self):
+        # The columnar dataset stores float32 values, whose models differ slightly from the CSV's: the version
+        # keeps their evaluation tables and cached responses apart
+        return f'{self.fingerprint}-columnar' if self.columnar is not None else self.fingerprint
+
+    @property
+    def rows(self) -> int:
+        """Number of beliefs, mapped ones included."""
+        mapped = sum(len(partition) for partition in self.columnar.partitions) if self.columnar is not None else 0
+        return mapped + (len(self.weather_data) if self.weather_data is not None else 0)
+
+    def memory_usage(self) -> int:
+        """
+        Estimated bytes this store holds: the belief frame and the sensor indexes (memory-mapped columns aside,
+        their pages belong to the page cache) and, once trained, the hourly series and the training data kept
+        by each fitted model.
+        """
+        usage = 0
+        if self.weather_data is not None:
+            usage += int(self.weather_data.memory_usage(deep=True).sum())
+        for index in self.sensor_indexes:
+            usage += sum(array.nbytes for array in (index.times, index.values, index.positions)
+                         if not _is_memory_mapped(array))
+        model = self.forecasting_model
+        if isinstance(model, ArtifactForecastModel):
+            model = model.fallback_model
+        series = model.model.series if isinstance(model, LazyForecastModel) and model.loaded else None
+        if series is not None:
+            hours = len(series.temperature_series)
+            # Three hourly series, and per fitted model the outcome and features of its training rows
+            usage += 3 * hours * 16 + len(model.fitted_models) * hours * (len(target_variables) + 1) * 8
+        return usage
+
+    def _train_model(self, fitted_models):
+        from my_weather_plugin.weather_forecast import WEATHER_FORECAST_MODEL
+
+        with self._lock:
+            if self.weather_data is None:
+                self._load_all()
+                # Rows appended to the CSV after the columnar conversion
+                self._ingest_appended()
+            return WEATHER_FORECAST_MODEL(weather_data=self.weather_data, fitted_models=fitted_models,
+                                          columnar=self.columnar)
+
+    def _read_bytes(self, complete_lines_only: bool) -> bytes:
+        """Read the bytes appended since the last read, keeping a trailing partial line for the next read."""
+        if self._digest is None:
+            self._digest = self._hash_read_bytes()
+        with open(self.data_path, 'rb') as file:
+            file.seek(self.offset)
+            content = file.read()
+        if complete_lines_only:
+            content = content[:content.rfind(b'\n') + 1]
+        self.offset += len(content)
+        self._digest.update(content)
+        self.fingerprint = self._digest.hexdigest()[:16]
+        return content
+
+    def _hash_read_bytes(self):
+        """Hash of the first offset bytes of the file, the bytes a columnar load did not read."""
+        digest = hashlib.sha256()
+        with open(self.data_path, 'rb') as file:
+            remaining = self.offset
+            while remaining > 0:
+                chunk = file.read(min(remaining, 2 ** 20))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+        return digest
+
+    def _load_all(self):
+        """
+        (Re)read the whole dataset and rebuild the sensor indexes.
+        A converted dataset is mapped rather than read: weather_data then only holds the rows appended to the CSV
+        since the conversion, and the hourly series are built from the mapped columns.
+        """
+        self.columnar = ColumnarBeliefs.load(self.data_path, self.columnar_dir) if self.columnar_dir else None
+        columnar = self.columnar
+        if columnar is not None:
+            self.weather_data = columnar.appended_frame()
+            self.columns = columnar.columns
+            self.sensor_indexes = tuple(columnar.sensor_indexes())
+            self.fingerprint = columnar.fingerprint
+            # Rows appended to the CSV since the conversion are read by the next refresh
+            self.offset = columnar.data_size
+            self._digest = None
+            return
+
+        self.offset = 0
+        self._digest = hashlib.sha256()
+        content = self._read_bytes(complete_lines_only=False)
+        self.weather_data = parse_weather_csv(io.BytesIO(content))
+        self.columns = list(pd.read_csv(io.BytesIO(content), nrows=0).columns)
+        self.sensor_indexes = tuple(
+            NearestValueIndex(table) for table in get_transformed_data_frames(weather_data=self.weather_data))
+
+    def refresh(self) -> dict:
+        """
+        Ingest the beliefs appended to the CSV since the last read, and update the sensor indexes, hourly series
+        and fitted models in place. Only the models whose training window changed are invalidated.
+        A file that shrank (rewritten rather than appended to) is reloaded in full.
+        Model artifacts are kept until beliefs are appended: their models no longer match the data then, and the
+        model is trained on the CSV from then on.
+        """
+        with self._lock:
+            if os.path.getsize(self.data_path) < self.offset:
+                return self._reload()
+
+            new_rows = self._ingest_appended()
+            if new_rows is None:
+                return {'new_rows': 0, 'invalidated_models': 0, 'data_version': self.data_version}
+            if not isinstance(self.forecasting_model, LazyForecastModel):
+                self._drop_artifacts()
+            return self._update_models(
+                len(new_rows), [sensor for sensor in target_variables if (new_rows['sensor'] == sensor).any()])
+
+    def _ingest_appended(self):
+        """
+        Parse the complete lines appended to the CSV since the last read and add them to the belief frame (when
+        it is loaded) and the sensor indexes. Returns the new rows, or None when there are none.
+        """
+        content = self._read_bytes(complete_lines_only=True)
+        if not content.strip():
+            return None
+
+        new_rows = parse_weather_csv(io.BytesIO(content), names=self.columns)
+        if self.weather_data is not None:
+            new_rows['sensor'] = new_rows['sensor'].astype(self.weather_data['sensor'].dtype)
+            new_rows.index = pd.RangeIndex(len(self.weather_data), len(self.weather_data) + len(new_rows))
+        new_rows = data_transform(new_rows)
+        if self.weather_data is not None:
+            self.weather_data = pd.concat([self.weather_data, new_rows])
+
+        self.sensor_indexes = tuple(index.merged(table) if len(table) else index
+                                    for index, table in zip(self.sensor_indexes, data_split(new_rows)))
+        return new_rows
+
+    def _drop_artifacts(self):
+        """Replace the model artifacts, built on the data as it was, by a model trained on the CSV on first use."""
+        fitted_models = self.forecasting_model.fitted_models
+        fitted_models.invalidate()
+        self.forecasting_model = LazyForecastModel(self._train_model, fitted_models)
+
+    def _reload(self) -> dict:
+        self._load_all()
+        self._ingest_appended()
+        if not isinstance(self.forecasting_model, LazyForecastModel):
+            self._drop_artifacts()
+        return self._update_models(self.rows, list(target_variables))
+
+    def _update_models(self, new_rows: int, sensors: list) -> dict:
+        models_before = len(self.forecasting_model.fitted_models)
+        if self.forecasting_model.loaded and sensors:
+            self.forecasting_model.refresh_series(self.weather_data, sensors, columnar=self.columnar)
+        self.evaluation_table = EvaluationTable.load(self.data_version, self.evaluation_dir)
+        return {
+            'new_rows': new_rows,
+            'invalidated_models': models_before - len(self.forecasting_model.fitted_models),
+            'data_version': self.data_version,
+        }
+
+    def watch(self, interval: float):
+        """Refresh in a background thread whenever the data file's size or modification time changes."""
+        def file_stat():
+            try:
+                stat = os.stat(self.data_path)
+            except OSError:
+                return None
+            return stat.st_size, stat.st_mtime_ns
+
+        def watch_file():
+            last_stat = file_stat()
+            while not self._stop_watching.wait(interval):
+                stat = file_stat()
+                if stat is not None and stat != last_stat:
+                    try:
+                        self.refresh()
+                    except Exception:
+                        logger.exception('Refresh of %s failed', self.data_path)
+                last_stat = stat
+
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=watch_file, name='weather-data-watch', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop_watching.set()
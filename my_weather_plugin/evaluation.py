@@ -0,0 +1,129 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from my_weather_plugin.consts import path_url, ARTIFACTS_DIR, EVALUATION_TABLE_VERSION, EVALUATION_LAGS
+
+_worker_model = None
+
+
+def dataset_fingerprint(path: str = path_url) -> str:
+    """
+    Hash the dataset file, so precomputed artifacts can be matched with the data they were computed on.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class EvaluationTable:
+    """
+    RMSE and percentage accuracy per lag for one dataset fingerprint.
+    Lags missing from the table are computed on demand and kept, so each is evaluated once per dataset.
+    Safe to share between waitress threads: lags are read and added through get/put, under the table's lock.
+    """
+    def __init__(self, fingerprint: str, lags: dict = None):
+        self.fingerprint = fingerprint
+        self.lags = lags or {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, lag: int) -> bool:
+        with self._lock:
+            return lag in self.lags
+
+    @staticmethod
+    def path_for(fingerprint: str, directory: str = ARTIFACTS_DIR) -> str:
+        return os.path.join(directory, f'evaluation_v{EVALUATION_TABLE_VERSION}_{fingerprint}.json')
+
+    @classmethod
+    def load(cls, fingerprint: str, directory: str = ARTIFACTS_DIR) -> 'EvaluationTable':
+        """
+        Load the table computed for this fingerprint, or an empty one when there is none (or of another version).
+        """
+        try:
+            with open(cls.path_for(fingerprint, directory)) as file:
+                content = json.load(file)
+        except (OSError, ValueError):
+            return cls(fingerprint)
+        if content.get('version') != EVALUATION_TABLE_VERSION or content.get('fingerprint') != fingerprint:
+            return cls(fingerprint)
+        return cls(fingerprint, {int(lag): result for lag, result in content['lags'].items()})
+
+    def save(self, directory: str = ARTIFACTS_DIR) -> str:
+        """Write the table as a versioned JSON artifact and return its path."""
+        os.makedirs(directory, exist_ok=True)
+        path = self.path_for(self.fingerprint, directory)
+        with self._lock:
+            lags = dict(self.lags)
+        with open(path, 'w') as file:
+            json.dump({
+                'version': EVALUATION_TABLE_VERSION,
+                'fingerprint': self.fingerprint,
+                'lags': {str(lag): result for lag, result in sorted(lags.items())},
+            }, file)
+        return path
+
+    def get(self, lag: int, compute) -> dict:
+        """Return the evaluation of lag, computing it with compute(lag) when the table does not have it yet."""
+        with self._lock:
+            evaluation = self.lags.get(lag)
+        if evaluation is None:
+            evaluation = self.put(lag, compute(lag))
+        return evaluation
+
+    def put(self, lag: int, evaluation: dict) -> dict:
+        """Keep the evaluation of lag (the first one kept wins, for concurrent computations) and return it."""
+        with self._lock:
+            return self.lags.setdefault(lag, evaluation)
+
+
+def evaluate_lag(forecasting_model, lag: int) -> dict:
+    """Evaluate one lag with the given model, in the format served by /forecast_rmse_precision."""
+    rmse_values, percentage_accuracy = forecasting_model.evaluate_models(lag)
+    return {
+        'rmse_values': {variable: float(value) for variable, value in rmse_values.items()},
+        'percentage_accuracy': {variable: float(value) for variable, value in percentage_accuracy.items()},
+    }
+
+
+def _init_worker(data_path):
+    global _worker_model
+    from my_weather_plugin.helpers import read_weather_data
+    from my_weather_plugin.weather_forecast import WEATHER_FORECAST_MODEL
+
+    _worker_model = WEATHER_FORECAST_MODEL(weather_data=read_weather_data(path=data_path))
+
+
+def _evaluate_lag_in_worker(lag):
+    return lag, evaluate_lag(_worker_model, lag)
+
+
+def build_evaluation_table(data_path: str = path_url, lags=EVALUATION_LAGS, processes: int = None) -> EvaluationTable:
+    """
+    Evaluate every lag on the dataset, running lags in parallel in a process pool (one model per worker).
+    """
+    table = EvaluationTable(dataset_fingerprint(data_path))
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(data_path,)) as executor:
+        for lag, result in executor.map(_evaluate_lag_in_worker, lags):
+            table.put(lag, result)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the RMSE/accuracy table served by /forecast_rmse_precision')
+    parser.add_argument('--data', default=path_url, help='belief CSV to evaluate the models on')
+    parser.add_argument('--output', default=ARTIFACTS_DIR, help='directory to write the evaluation table to')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    table = build_evaluation_table(args.data, processes=args.processes)
+    print(f'Evaluation table written to {table.save(args.output)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import threading
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+import numpy as np
+
+from my_weather_plugin.consts import target_variables, feature_variables, MAX_FORECAST_HORIZON
+from my_weather_plugin.model_cache import FittedModelCache
+
+
+class ParameterForecaster(ABC):
+    """
+    Vectorized forecasting shared by the models: everything here only needs get_lag_parameters(lag),
+    the (target variables x features) matrix of a lag's OLS coefficients, and NumPy.
+    """
+    @abstractmethod
+    def get_lag_parameters(self, lag=24) -> np.ndarray:
+        """The (target variables x features) matrix of the coefficients of the lag's models."""
+
+    def forecast_batch(self, features: np.ndarray, lags) -> dict:
+        """
+        Forecast many feature rows (in feature_variables order) at once, each with its own lag.
+        Rows are grouped by lag and every group is one matrix product with that lag's coefficients.
+        Returns one array per target variable, in the order of the rows.
+        """
+        features = np.asarray(features, dtype=float)
+        lags = np.asarray(lags)
+        forecasts = np.empty((len(lags), len(target_variables)))
+        for lag in np.unique(lags):
+            rows = lags == lag
+            forecasts[rows] = features[rows] @ self.get_lag_parameters(int(lag)).T
+        return {target_variable: forecasts[:, position] for position, target_variable in enumerate(target_variables)}
+
+    def forecast_curve(self, now, calculation_mesures, horizons=range(1, MAX_FORECAST_HORIZON + 1)) -> dict:
+        """
+        Forecast every horizon from 'now' in one go: the per-lag coefficients are stacked into a
+        (horizons x target variables x features) array and applied to the current measures in one operation.
+        Returns columnar output: the forecasted timestamps and one list of values per target variable.
+        """
+        features = np.array([calculation_mesures[variable] for variable in feature_variables], dtype=float)
+        parameters = np.stack([self.get_lag_parameters(lag) for lag in horizons])
+        forecasts = parameters @ features
+        curve = {'timestamps': [(now + timedelta(hours=lag)).strftime('%Y-%m-%d %H:%M:%S') for lag in horizons]}
+        for position, target_variable in enumerate(target_variables):
+            curve[target_variable] = forecasts[:, position].tolist()
+        return curve
+
+
+class LazyForecastModel:
+    """
+    Defers building the statsmodels/timetomodel backed model until a forecasting path first needs it,
+    so neither stack is imported at startup. The model cache exists up front and is handed to the model,
+    so its counters can be reported (e.g. by the status endpoint) without loading anything.
+    """
+    def __init__(self, factory, fitted_models: FittedModelCache = None):
+        self.fitted_models = fitted_models if fitted_models is not None else FittedModelCache()
+        self._factory = factory
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self):
+        """The underlying model, built with factory(fitted_models) on first access."""
+        with self._lock:
+            if self._model is None:
+                self._model = self._factory(self.fitted_models)
+                self._factory = None
+            return self._model
+
+    def __getattr__(self, attribute):
+        return getattr(self.model, attribute)
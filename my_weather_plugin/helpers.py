@@ -1,54 +1,147 @@
+from __future__ import annotations
+
+import hmac
+import inspect
+import logging
+import time
 import traceback
+from contextlib import nullcontext
 from datetime import datetime
 
-import pandas
-import pandas as pd
-from flask import jsonify
-from dateutil.parser import parse
+import numpy as np
+from flask import g, jsonify, make_response, request
+
+from my_weather_plugin.consts import csv_url, THRESHOLDS, path_url, CSV_DTYPES, CSV_COLUMNS, ADMIN_TOKEN, \
+    DEFAULT_SITE
+from my_weather_plugin.lazy import lazy_import
+from my_weather_plugin.metrics import metrics, timed, profiles, SamplingProfiler
+
+logger = logging.getLogger(__name__)
+
+# pandas and dateutil are only imported once a path needing them runs (not for the status endpoint)
+pandas = pd = lazy_import('pandas')
+dateutil_parser = lazy_import('dateutil.parser')
+
+
+class ServiceOverloaded(Exception):
+    """Raised when the server has too much work queued to accept more, answered with a 503."""
+
 
-from my_weather_plugin.consts import csv_url, THRESHOLDS, path_url
+class UnknownSite(Exception):
+    """Raised for a site parameter naming no configured site, answered with a 404."""
+
+
+def is_admin_request() -> bool:
+    """Whether the X-Admin-Token header carries ADMIN_TOKEN, never the case while no token is configured."""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+
+def _profiling_requested() -> bool:
+    """Whether this request asked to be profiled (X-Profile: 1), honoured for admins only."""
+    return request.headers.get('X-Profile') == '1' and is_admin_request()
 
 
 def handle_request_errors(f):
     """
-    Decorator function to handle exceptions that occur within Flask routes.
+    Decorator function to handle exceptions that occur within Flask routes (sync or async).
     It logs the error and returns a JSON response indicating the failure.
+    Each request's duration and status are recorded in the metrics (per endpoint and site), and a request sent
+    with the X-Profile: 1 header (and the admin token) is run under the sampling profiler, its profile being
+    served at /metrics/profiles/<X-Profile-Id>.
     """
+    def handle_error(error):
+        if isinstance(error, ServiceOverloaded):
+            return jsonify({'error': str(error) or 'Server overloaded, please retry later'}), 503, {'Retry-After': '1'}
+        if isinstance(error, UnknownSite):
+            return jsonify({'error': str(error)}), 404
+        error_msg = f'Error on {f.__name__} \n{traceback.format_exc()}'
+        logger.exception('Error on %s', f.__name__)
+        response = {
+            'result': 'failed',
+            'status': 'down',
+            'error': error_msg
+
+        }
+        return jsonify(response), 500
+
+    def record(result, start: float, profiler: SamplingProfiler = None):
+        response = make_response(result)
+        elapsed = time.perf_counter() - start
+        # The site the view resolved (unknown ones share one label, so the label values stay bounded)
+        site = g.get('site', DEFAULT_SITE)
+        metrics.observe('weather_request_duration_seconds', elapsed, endpoint=f.__name__, site=site)
+        metrics.increment('weather_requests_total', endpoint=f.__name__, status=response.status_code, site=site)
+        logger.debug('%s answered %s in %.1fms', f.__name__, response.status_code, 1000 * elapsed)
+        if profiler is not None:
+            response.headers['X-Profile-Id'] = profiles.add(profiler.collapsed())
+        return response
+
+    if inspect.iscoroutinefunction(f):
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            profiler = SamplingProfiler() if _profiling_requested() else None
+            with profiler or nullcontext():
+                try:
+                    result = await f(*args, **kwargs)
+                except Exception as error:
+                    result = handle_error(error)
+            return record(result, start, profiler)
+
+        return async_wrapper
+
     def wrapper(*args, **kwargs):
-        try:
-            print(f'start {f.__name__}')
-            return f(*args, **kwargs)
-        except:
-            error_msg = f'Error on {f.__name__} \n{traceback.format_exc()}'
-            traceback.print_exc()
-            response = {
-                'result': 'failed',
-                'status': 'down',
-                'error': error_msg
-
-            }
-            return jsonify(response), 500
+        start = time.perf_counter()
+        profiler = SamplingProfiler() if _profiling_requested() else None
+        with profiler or nullcontext():
+            try:
+                result = f(*args, **kwargs)
+            except Exception as error:
+                result = handle_error(error)
+        return record(result, start, profiler)
 
     return wrapper
 
 
+@timed('parse_date')
 def parse_date(date: str) -> datetime:
     """
     Parse a string date into a datetime object, assuming the year is first.
     """
     # return pd.to_datetime(date, yearfirst=True, utc=True).to_pydatetime()
-    return parse(date, yearfirst=True, ignoretz=True)
+    return dateutil_parser.parse(date, yearfirst=True, ignoretz=True)
 
 
-def get_transformed_data_frames(get_online: bool = False) -> [pd.DataFrame]:
+def read_weather_data(get_online: bool = False, path: str = path_url) -> pd.DataFrame:
+    """
+    Read the belief CSV once, either online from the original git repo or local.
+    Only the used columns are kept, with explicit dtypes, a categorical sensor column and UTC event starts.
+    The same frame feeds both the Flask layer and the forecasting model.
+    """
+    return parse_weather_csv(csv_url if get_online else path)
+
+
+def parse_weather_csv(source, names: list = None) -> pd.DataFrame:
+    """
+    Parse belief CSV content from a path, URL or file-like object.
+    names gives the column names when the content has no header line (e.g. rows appended since the last read).
     """
-    Fetch weather data from a CSV, either online from the original git repo or local,
+    weather_data = pandas.read_csv(source, usecols=CSV_COLUMNS, dtype=CSV_DTYPES, names=names,
+                                   header=None if names else 'infer')
+    weather_data['event_start'] = pd.to_datetime(weather_data['event_start'], utc=True, infer_datetime_format=True)
+    return weather_data
+
+
+def get_transformed_data_frames(get_online: bool = False, weather_data: pd.DataFrame = None,
+                                columnar=None) -> [pd.DataFrame]:
+    """
+    Fetch weather data from a CSV (unless an already read frame is given),
     then transform and split by sensor type.
+    A columnar dataset (ColumnarBeliefs) is already split: its frames wrap the memory-mapped columns.
     """
-    if get_online:
-        weather_data = pandas.read_csv(csv_url)
-    else:
-        weather_data = pandas.read_csv(path_url)
+    if columnar is not None:
+        return columnar.sensor_frames()
+    if weather_data is None:
+        weather_data = read_weather_data(get_online=get_online)
     transformed_weather_data = data_transform(weather_data)
     [temperature, irradiance, wind_speed] = data_split(transformed_weather_data)
     return [temperature, irradiance, wind_speed]
@@ -79,21 +172,132 @@ def extract_nearset_value_to_date(table, given_date):
     Extract the closest event value to a given date from the DataFrame.
     """
     # table = table[table.event_start == given_date]
-    return table.loc[(table['exact_time'] - pd.to_datetime(given_date, utc=True)).abs().idxmin()]['event_value']
+    distances = (table['exact_time'] - pd.to_datetime(given_date, utc=True)).abs()
+    # By position: a label lookup builds the index's hash table lazily, which races between request threads
+    return table['event_value'].iloc[distances.argmin()]
 
 
+def to_utc_nanoseconds(dates) -> np.ndarray:
+    """
+    Convert one or many dates to int64 UTC epoch nanoseconds, naive dates being taken as UTC.
+    Naive datetimes (what parse_date returns) are converted with NumPy alone, without importing pandas.
+    """
+    if isinstance(dates, datetime):
+        dates = [dates]
+    if isinstance(dates, (list, tuple)) and all(isinstance(date, datetime) and date.tzinfo is None for date in dates):
+        return np.array(dates, dtype='datetime64[ns]').view('int64')
+    return pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(dates), utc=True)).asi8
+
+
+class NearestValueIndex:
+    """
+    A sensor frame sorted on 'exact_time' once at load, so the closest observation to a date is found
+    by a binary search (O(log n), no temporary Series) instead of a full scan.
+    It returns the same value as extract_nearset_value_to_date, ties included.
+    """
+    def __init__(self, table: pd.DataFrame):
+        times = to_utc_nanoseconds(table['exact_time'])
+        # A stable sort keeps rows with the same exact_time in frame order, like idxmin picks the first one
+        order = np.argsort(times, kind='stable')
+        self.times = np.ascontiguousarray(times[order])
+        self.values = np.ascontiguousarray(table['event_value'].to_numpy()[order])
+        self.positions = order
+
+    @classmethod
+    def from_arrays(cls, times: np.ndarray, values: np.ndarray, positions: np.ndarray) -> 'NearestValueIndex':
+        """Rebuild an index from its already sorted arrays (e.g. memory-mapped model artifacts)."""
+        index = cls.__new__(cls)
+        index.times, index.values, index.positions = times, values, positions
+        return index
+
+    def merged(self, table: pd.DataFrame) -> 'NearestValueIndex':
+        """
+        Return a new index with the rows of table appended after the indexed ones.
+        Appended rows come after existing rows with the same exact_time, as they would in the concatenated frame.
+        """
+        appended = NearestValueIndex(table)
+        times = np.concatenate([self.times, appended.times])
+        # The existing rows are sorted already, so the stable sort mostly merges two sorted runs
+        order = np.argsort(times, kind='stable')
+        return NearestValueIndex.from_arrays(
+            np.ascontiguousarray(times[order]),
+            np.ascontiguousarray(np.concatenate([self.values, appended.values])[order]),
+            np.concatenate([self.positions, appended.positions + len(self.positions)])[order],
+        )
+
+    def __len__(self):
+        return len(self.times)
+
+    def lookup_positions(self, dates) -> np.ndarray:
+        """
+        Return the sorted positions of the observations closest to each of the given dates.
+        """
+        when = to_utc_nanoseconds(dates)
+        last = len(self.times) - 1
+        # First observation at or after the date, and the first observation of the run just before it
+        insertion = np.searchsorted(self.times, when, side='left')
+        after = np.minimum(insertion, last)
+        before = np.searchsorted(self.times, self.times[np.maximum(insertion - 1, 0)], side='left')
+
+        distance_after = np.abs(self.times[after] - when)
+        distance_before = np.abs(when - self.times[before])
+        take_after = (distance_after < distance_before) | (
+            (distance_after == distance_before) & (self.positions[after] < self.positions[before]))
+        return np.where(take_after, after, before)
+
+    def lookup(self, date):
+        """Return the value of the observation closest to date."""
+        return self.values[self.lookup_positions(date)[0]]
+
+    def lookup_time(self, date) -> int:
+        """Return the exact_time (UTC epoch nanoseconds) of the observation closest to date."""
+        return int(self.times[self.lookup_positions(date)[0]])
+
+    def lookup_many(self, dates) -> np.ndarray:
+        """Return the values of the observations closest to each of the given dates, in one vectorized call."""
+        return self.values[self.lookup_positions(dates)]
+
+
+@timed('nearest_lookup')
 def get_nearst_values_to_now(temperature, irradiance, wind_speed, now):
     """
     Retrieve the closest data points to the current date ('now') for all sensors.
+    Sensors are given as NearestValueIndex (or as raw frames, scanned with extract_nearset_value_to_date).
     """
-    # looked_date = pd.date_range(start=now, end=now, freq="H")
-    temperature_value = extract_nearset_value_to_date(temperature, now)
-    irradiance_value = extract_nearset_value_to_date(irradiance, now)
-    wind_speed_value = extract_nearset_value_to_date(wind_speed, now)
+    if isinstance(temperature, NearestValueIndex):
+        temperature_value = temperature.lookup(now)
+        irradiance_value = irradiance.lookup(now)
+        wind_speed_value = wind_speed.lookup(now)
+    else:
+        temperature_value = extract_nearset_value_to_date(temperature, now)
+        irradiance_value = extract_nearset_value_to_date(irradiance, now)
+        wind_speed_value = extract_nearset_value_to_date(wind_speed, now)
 
     return {'temperature': temperature_value, 'irradiance': irradiance_value, 'wind_speed': wind_speed_value}
 
 
+@timed('nearest_lookup')
+def get_nearst_observation_times(temperature, irradiance, wind_speed, now) -> tuple:
+    """
+    Return the exact times of the observations get_nearst_values_to_now would use for 'now'.
+    Two dates resolving to the same observations get the same forecasts, which is what response caching relies on.
+    """
+    return temperature.lookup_time(now), irradiance.lookup_time(now), wind_speed.lookup_time(now)
+
+
+@timed('nearest_lookup')
+def get_nearst_values_to_many(temperature, irradiance, wind_speed, nows) -> dict:
+    """
+    Batch variant of get_nearst_values_to_now: resolve many 'now' dates at once for all sensor indexes.
+    Returns one array of values per sensor, in the order of nows.
+    """
+    return {
+        'temperature': temperature.lookup_many(nows),
+        'irradiance': irradiance.lookup_many(nows),
+        'wind_speed': wind_speed.lookup_many(nows),
+    }
+
+
 def get_difference_of_hour_between_two_dates(now, then):
     """
     Calculate the difference in hours between two datetime objects.
@@ -0,0 +1,19 @@
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is only imported on first attribute access.
+    Used for the heavy dependencies (pandas, dateutil, ...) that the status endpoint never needs.
+    """
+    def __getattr__(self, attribute):
+        # import_module holds the import lock, so concurrent first accesses import the module only once
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """Return a module that is imported the first time one of its attributes is used."""
+    return LazyModule(name)
@@ -0,0 +1,102 @@
+"""
+Load test showing how /forecasts throughput scales with the number of worker processes.
+
+    python -m my_weather_plugin.load_test --workers 1 2 4 --duration 20 --clients 32
+
+For each worker count a server is started with `python main.py --workers N`, hammered by client processes
+for the given duration, and stopped. Results are printed as a table and written as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from urllib.error import URLError
+from urllib.request import urlopen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_ready(base_url: str, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urlopen(f'{base_url}/', timeout=1):
+                return
+        except (URLError, OSError):
+            time.sleep(0.2)
+    raise TimeoutError(f'server at {base_url} not ready after {timeout}s')
+
+
+def run_client(base_url: str, duration: float, seed: int) -> dict:
+    """Request forecasts for random 'now' (last 30 days) and lags until duration is over."""
+    rng = random.Random(seed)
+    requests, errors, latencies = 0, 0, []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        now = datetime.now() - timedelta(hours=rng.randrange(24 * 30))
+        then = now + timedelta(hours=rng.randrange(1, 49))
+        url = f"{base_url}/forecasts?now={now.strftime('%Y-%m-%dT%H:%M:%S')}&then={then.strftime('%Y-%m-%dT%H:%M:%S')}"
+        start = time.perf_counter()
+        try:
+            with urlopen(url, timeout=30) as response:
+                response.read()
+            requests += 1
+        except (URLError, OSError):
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return {'requests': requests, 'errors': errors, 'latencies': latencies}
+
+
+def measure(workers: int, clients: int, duration: float, port: int) -> dict:
+    """Start a server with this many workers, load it with clients for duration seconds and stop it."""
+    base_url = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen([sys.executable, 'main.py', '--workers', str(workers), '--port', str(port)], cwd=ROOT)
+    try:
+        wait_until_ready(base_url)
+        with ProcessPoolExecutor(max_workers=clients) as executor:
+            results = list(executor.map(run_client, [base_url] * clients, [duration] * clients, range(clients)))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    latencies = sorted(latency for result in results for latency in result['latencies'])
+    requests = sum(result['requests'] for result in results)
+    return {
+        'workers': workers,
+        'clients': clients,
+        'requests': requests,
+        'errors': sum(result['errors'] for result in results),
+        'throughput': requests / duration,
+        'p50_ms': 1000 * latencies[len(latencies) // 2] if latencies else None,
+        'p99_ms': 1000 * latencies[int(len(latencies) * 0.99)] if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--output', default='load_test.json')
+    args = parser.parse_args()
+
+    results = []
+    for workers in sorted(set(args.workers)):
+        result = measure(workers, args.clients, args.duration, args.port)
+        results.append(result)
+        print(f"workers={workers:3d}  throughput={result['throughput']:9.1f} req/s  "
+              f"p50={result['p50_ms']:.1f}ms  p99={result['p99_ms']:.1f}ms  errors={result['errors']}")
+
+    with open(args.output, 'w') as file:
+        json.dump({'cpu_count': os.cpu_count(), 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
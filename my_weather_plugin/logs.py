@@ -0,0 +1,48 @@
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+from my_weather_plugin.consts import LOG_LEVEL
+
+_listener = None
+
+
+def configure_logging(level: str = LOG_LEVEL) -> logging.Logger:
+    """
+    Send the package's log records through a queue to a background thread writing them to stderr,
+    so request threads only enqueue a record and never block on the stream.
+    """
+    global _listener
+    logger = logging.getLogger('my_weather_plugin')
+    logger.setLevel(level)
+    if _listener is None:
+        records = queue.SimpleQueue()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s'))
+        _listener = QueueListener(records, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        logger.addHandler(QueueHandler(records))
+        logger.propagate = False
+    return logger
+
+
+def _restart_listener_in_child():
+    """
+    A forked process (pre-fork worker) inherits the queue but not the listener's thread: it gets its own queue
+    (records the parent had not written yet stay the parent's) and listener.
+    """
+    global _listener
+    if _listener is not None:
+        records = queue.SimpleQueue()
+        for handler in logging.getLogger('my_weather_plugin').handlers:
+            if isinstance(handler, QueueHandler):
+                handler.queue = records
+        _listener = QueueListener(records, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener_in_child)
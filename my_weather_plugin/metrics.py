@@ -0,0 +1,182 @@
+import bisect
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from my_weather_plugin.consts import PROFILE_INTERVAL, PROFILES_KEPT
+
+# Upper bounds (seconds) of the duration histogram buckets, from a date parse to a model fit
+DURATION_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels: tuple, **extra) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class MetricsRegistry:
+    """
+    In-memory histograms and counters of this process, rendered in the Prometheus text format by /metrics.
+    Recording is a dictionary lookup and a few additions under a lock, cheap enough for every request stage.
+    """
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, description: str):
+        self._help[name] = (kind, description)
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def timed(self, stage: str):
+        """Record the duration of the block (or decorated function) in the stage's histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('weather_stage_duration_seconds', time.perf_counter() - start, stage=stage)
+
+    def snapshot(self, name: str, **labels) -> Histogram:
+        with self._lock:
+            return self._histograms.get((name, tuple(labels.items())))
+
+    def render(self, collected: dict = None) -> str:
+        """
+        Prometheus text exposition of every metric, plus values kept elsewhere (e.g. cache counters)
+        given as {name: (type, description, value)}, value being a number or a list of (labels dict, number).
+        """
+        lines = []
+
+        def header(name, kind):
+            kind, description = self._help.get(name, (kind, name))
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            counters = sorted(self._counters.items(), key=lambda item: item[0])
+            previous = None
+            for (name, labels), histogram in histograms:
+                if name != previous:
+                    header(name, 'histogram')
+                    previous = name
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {histogram.count}')
+                lines.append(f'{name}_sum{_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+            for (name, labels), value in counters:
+                if name != previous:
+                    header(name, 'counter')
+                    previous = name
+                lines.append(f'{name}{_labels(labels)} {value}')
+        for name, (kind, description, value) in (collected or {}).items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            samples = value if isinstance(value, list) else [({}, value)]
+            lines.extend(f'{name}{_labels(tuple(labels.items()))} {sample}' for labels, sample in samples)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+metrics.describe('weather_stage_duration_seconds', 'histogram', 'Duration of the stages of a request')
+metrics.describe('weather_request_duration_seconds', 'histogram', 'Duration of the requests per endpoint and site')
+metrics.describe('weather_requests_total', 'counter', 'Requests per endpoint, status code and site')
+metrics.describe('weather_stream_errors_total', 'counter', 'Streamed responses cut off by an error, per endpoint')
+metrics.describe('weather_site_loads_total', 'counter', 'Loads of a site into the site pool')
+metrics.describe('weather_site_evictions_total', 'counter', 'Unloads of a site to stay within the memory budget')
+timed = metrics.timed
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread every interval seconds from a background thread, so the profiled code runs
+    unmodified. The samples are kept as collapsed stacks ('outer;inner count'), the flame graph input format.
+    """
+    def __init__(self, thread_id: int = None, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='weather-profiler', daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def __enter__(self) -> 'SamplingProfiler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+class ProfileStore:
+    """The last PROFILES_KEPT request profiles, by id."""
+    def __init__(self, maxsize: int = PROFILES_KEPT):
+        self.maxsize = maxsize
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: str) -> str:
+        profile_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._profiles[profile_id] = profile
+            while len(self._profiles) > self.maxsize:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+profiles = ProfileStore()
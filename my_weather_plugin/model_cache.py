@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from my_weather_plugin.consts import MODEL_CACHE_SIZE
+
+
+class FittedModelCache:
+    """
+    Bounded LRU registry of fitted models keyed by (target_variable, lag).
+    Keeps hit/miss counters so we can see how often a request avoids a refit.
+    It is safe to share between waitress threads: concurrent misses on the same key are single-flight,
+    so only one thread runs the (CPU heavy) factory while the others wait for its result.
+    """
+    def __init__(self, maxsize: int = MODEL_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get_or_create(self, key, factory, generation: int = None):
+        """
+        Return the cached entry for key, building it with factory() on a miss.
+        The entry becomes the most recently used one and the oldest entries are evicted past maxsize.
+        Entries built before an invalidate() (or for an older generation than the current one)
+        are handed to their callers but never stored.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                self.misses += 1
+                in_flight = self._in_flight[key] = Future()
+                if generation is None:
+                    generation = self.generation
+                owner = True
+            else:
+                self.hits += 1
+                owner = False
+
+        if not owner:
+            return in_flight.result()
+
+        try:
+            entry = factory()
+        except BaseException as error:
+            with self._lock:
+                if self._in_flight.get(key) is in_flight:
+                    del self._in_flight[key]
+            in_flight.set_exception(error)
+            raise
+
+        with self._lock:
+            if self._in_flight.get(key) is in_flight:
+                del self._in_flight[key]
+            if generation == self.generation:
+                self._entries[key] = entry
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        in_flight.set_result(entry)
+        return entry
+
+    def keys(self) -> list:
+        """Return the cached keys, least recently used first."""
+        with self._lock:
+            return list(self._entries)
+
+    def peek(self, key):
+        """Return the entry of key, or None, without counting a hit or a miss nor changing its recency."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def replace(self, key, update):
+        """Replace the entry of key (if still cached) with update(entry), without counting a hit or a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = update(self._entries[key])
+
+    def invalidate(self, keys=None):
+        """
+        Drop the given keys, or every entry when keys is None (e.g. the underlying series changed).
+        """
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+                self._in_flight.clear()
+                self.generation += 1
+                return
+            for key in keys:
+                self._entries.pop(key, None)
+                self._in_flight.pop(key, None)
+            self.generation += 1
+
+    def stats(self) -> dict:
+        """Return the current size and hit/miss counters of the cache."""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,104 @@
+import asyncio
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future
+
+from my_weather_plugin.consts import OFFLOAD_WORKERS, OFFLOAD_MAX_PENDING, OFFLOAD_WORKER_SITES
+from my_weather_plugin.helpers import ServiceOverloaded, get_nearst_values_to_now
+from my_weather_plugin.sites import SiteConfig, default_site_config
+
+# Data stores of the sites this worker served last, least recently used first
+_worker_stores = OrderedDict()
+
+
+def _init_worker(site: SiteConfig):
+    _worker_stores[site] = site.create_store()
+
+
+def _store_for(site: SiteConfig, data_version):
+    """
+    The worker's data store of the site, loaded on its first task (the OFFLOAD_WORKER_SITES most recently used
+    are kept) and refreshed first when the server has moved on to newer data.
+    """
+    store = _worker_stores.get(site)
+    if store is None:
+        store = _worker_stores[site] = site.create_store()
+        while len(_worker_stores) > OFFLOAD_WORKER_SITES:
+            _worker_stores.popitem(last=False)
+    _worker_stores.move_to_end(site)
+    if store.data_version != data_version:
+        store.refresh()
+    return store
+
+
+def forecast_in_worker(site: SiteConfig, now, lag, data_version) -> dict:
+    store = _store_for(site, data_version)
+    calculation_mesures = get_nearst_values_to_now(*store.sensor_indexes, now)
+    forecast = store.forecasting_model.forecast_model(now, calculation_mesures, lag)
+    return {variable: float(value) for variable, value in forecast.items()}
+
+
+def evaluate_in_worker(site: SiteConfig, lag, data_version) -> dict:
+    from my_weather_plugin.evaluation import evaluate_lag
+
+    return evaluate_lag(_store_for(site, data_version).forecasting_model, lag)
+
+
+class ComputeOffloader:
+    """
+    Bounded process pool running the CPU heavy forecasting work of async routes, so waitress threads only
+    wait on it and status checks or cached responses are never stuck behind a slow fit.
+    Identical in-flight computations (same key) share one future, and once max_pending distinct computations
+    are queued or running new ones are refused with ServiceOverloaded (a 503).
+    """
+    def __init__(self, max_workers: int = OFFLOAD_WORKERS, max_pending: int = OFFLOAD_MAX_PENDING,
+                 site: SiteConfig = None):
+        # Workers are spawned rather than forked, the server process runs threads. They preload the given site
+        # (the default one when not given), the others are loaded by their first task.
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_worker, initargs=(site or default_site_config(),))
+        self.max_pending = max_pending
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def submit(self, key, function, *args) -> Future:
+        """Run function(*args) in the pool, or join the in-flight computation of the same key."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            if len(self._in_flight) >= self.max_pending:
+                self.rejected += 1
+                raise ServiceOverloaded('Too many forecasts being computed, please retry later')
+            future = self._executor.submit(function, *args)
+            self._in_flight[key] = future
+            self.submitted += 1
+        future.add_done_callback(lambda done: self._done(key, done))
+        return future
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    async def run(self, key, function, *args):
+        """Await the result of function(*args) computed in the pool (see submit)."""
+        return await asyncio.wrap_future(self.submit(key, function, *args))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'pending': len(self._in_flight),
+                'max_pending': self.max_pending,
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'rejected': self.rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
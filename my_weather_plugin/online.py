@@ -0,0 +1,100 @@
+from copy import deepcopy
+
+import numpy as np
+
+
+class RecursiveLeastSquares:
+    """
+    Online OLS estimator keeping the sufficient statistics X'X and X'y.
+    Rows are added (or removed, for sliding windows) without touching the history, and the coefficients
+    are updated with Sherman-Morrison steps in O(k²) per row, k being the number of features.
+    """
+    def __init__(self, n_features: int):
+        self.xtx = np.zeros((n_features, n_features))
+        self.xty = np.zeros(n_features)
+        self.n_observations = 0
+        self._inverse = None
+        self._params = np.zeros(n_features)
+
+    @property
+    def params(self) -> np.ndarray:
+        return self._params
+
+    def _resync(self):
+        """Recompute the inverse and coefficients from the sufficient statistics (e.g. after many rows at once)."""
+        if self.n_observations < len(self.xty):
+            self._inverse = None
+            self._params = np.linalg.lstsq(self.xtx, self.xty, rcond=None)[0]
+            return
+        self._inverse = np.linalg.pinv(self.xtx)
+        self._params = self._inverse @ self.xty
+
+    def _step(self, x: np.ndarray, y: float, sign: int):
+        """Sherman-Morrison update of the inverse and coefficients for adding (+1) or removing (-1) one row."""
+        inverse_x = self._inverse @ x
+        gain = inverse_x / (sign + x @ inverse_x)
+        self._params = self._params + gain * (y - x @ self._params)
+        self._inverse = self._inverse - np.outer(gain, inverse_x)
+
+    def _apply(self, x, y, sign: int):
+        x = np.atleast_2d(np.asarray(x, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        complete = ~(np.isnan(x).any(axis=1) | np.isnan(y))
+        x, y = x[complete], y[complete]
+        if len(y) == 0:
+            return
+
+        self.xtx += sign * (x.T @ x)
+        self.xty += sign * (x.T @ y)
+        self.n_observations += sign * len(y)
+        if self._inverse is None or len(y) > len(self.xty):
+            # Solving once is cheaper than a Sherman-Morrison step per row
+            self._resync()
+            return
+        for row, value in zip(x, y):
+            self._step(row, value, sign)
+
+    def update(self, x, y):
+        """Add observation rows x (n x k) with outcomes y (n), rows with missing values are skipped."""
+        self._apply(x, y, 1)
+
+    def downdate(self, x, y):
+        """Remove previously added observation rows, e.g. the oldest rows of a sliding window."""
+        self._apply(x, y, -1)
+
+    def predict(self, x) -> np.ndarray:
+        return np.atleast_2d(np.asarray(x, dtype=float)) @ self._params
+
+
+class OnlineOLSModel:
+    """
+    Fitted model backed by RecursiveLeastSquares, usable where timetomodel expects a fitted statsmodels OLS
+    (params, predict). It remembers the last outcome timestamp it was trained on, so newer rows can be added.
+    """
+    def __init__(self, estimator: RecursiveLeastSquares, trained_until=None):
+        self.estimator = estimator
+        self.trained_until = trained_until
+
+    def __copy__(self) -> 'OnlineOLSModel':
+        return type(self)(deepcopy(self.estimator), self.trained_until)
+
+    @classmethod
+    def fit(cls, regression_frame) -> 'OnlineOLSModel':
+        """Fit on a timetomodel regression frame: the outcome in the first column, the features in the others."""
+        model = cls(RecursiveLeastSquares(regression_frame.shape[1] - 1))
+        model.update(regression_frame)
+        return model
+
+    def update(self, regression_frame):
+        """Add the rows of a regression frame (same layout as for fit) to the model."""
+        if len(regression_frame) == 0:
+            return
+        self.estimator.update(regression_frame.iloc[:, 1:].to_numpy(), regression_frame.iloc[:, 0].to_numpy())
+        self.trained_until = regression_frame.index[-1]
+
+    @property
+    def params(self) -> np.ndarray:
+        return self.estimator.params
+
+    def predict(self, exog, *args, **kwargs) -> np.ndarray:
+        return self.estimator.predict(exog)
@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from my_weather_plugin.consts import RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_URL
+
+
+class LocalBackend:
+    """
+    In-process storage with a time to live and least recently used eviction past maxsize.
+    Also the stand-in for the shared backend in tests and single worker deployments.
+    """
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, clock=time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisBackend:
+    """
+    Storage shared by every worker process, in Redis. Values are stored as JSON and expire after their ttl.
+    Needs the optional redis package, unless a client (anything with Redis' get and set) is given.
+    """
+    def __init__(self, url: str = None, client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self._client = client
+
+    def get(self, key: str):
+        value = self._client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value, ttl: float):
+        self._client.set(key, json.dumps(value, default=float), px=int(ttl * 1000))
+
+    def clear(self):
+        pass
+
+
+def create_backend(url: str = RESPONSE_CACHE_URL):
+    """Return the shared backend at url, or an in-process one when no url is configured."""
+    if url:
+        return RedisBackend(url)
+    return LocalBackend()
+
+
+class ResponseCache:
+    """
+    Cache of computed endpoint responses with hit/miss counters.
+    Keys are built by the caller from everything the response depends on (inputs and data version).
+    """
+    def __init__(self, backend=None, ttl: float = RESPONSE_CACHE_TTL):
+        self.backend = backend if backend is not None else create_backend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return 'weather:' + ':'.join(str(part) for part in parts)
+
+    def get(self, key: str):
+        """Return the cached response of key, or None, counting a hit or a miss."""
+        value = self.backend.get(key)
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    def set(self, key: str, value):
+        self.backend.set(key, value, self.ttl)
+
+    def get_or_compute(self, key: str, compute):
+        """Return the cached response of key, or compute(), store and return it."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
+        if isinstance(self.backend, LocalBackend):
+            stats.update(size=len(self.backend), maxsize=self.backend.maxsize, evictions=self.backend.evictions)
+        return stats
@@ -0,0 +1,119 @@
+import logging
+import os
+import signal
+import socket
+import time
+
+from my_weather_plugin.artifacts import ModelArtifacts, build_model_artifacts
+from my_weather_plugin.columnar import ColumnarBeliefs, convert_to_columnar
+from my_weather_plugin.consts import path_url, MODEL_ARTIFACTS_DIR, WAITRESS_THREADS, COLUMNAR_DIR
+from my_weather_plugin.logs import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_model_artifacts(data_path: str = path_url, artifacts_dir: str = MODEL_ARTIFACTS_DIR):
+    """Build the model artifacts when they are missing or stale, so every worker can map them."""
+    if ModelArtifacts.load(data_path, artifacts_dir) is None:
+        logger.info('Building model artifacts in %s', artifacts_dir)
+        build_model_artifacts(data_path, artifacts_dir)
+
+
+def ensure_columnar_beliefs(data_path: str = path_url, directory: str = COLUMNAR_DIR):
+    """Convert the CSV to the columnar dataset when it is missing or stale, so every worker can map it."""
+    if ColumnarBeliefs.load(data_path, directory) is None:
+        logger.info('Converting %s to a columnar dataset in %s', data_path, directory)
+        convert_to_columnar(data_path, directory)
+
+
+def create_listening_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app_factory, sock: socket.socket, threads: int):
+    from waitress import serve
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    try:
+        serve(app_factory(), sockets=[sock], threads=threads)
+    except Exception:
+        logger.exception('Worker %s failed', os.getpid())
+        os._exit(1)
+    os._exit(0)
+
+
+def serve_prefork(app_factory, workers: int, host: str = '0.0.0.0', port: int = 5000,
+                  threads: int = WAITRESS_THREADS, data_path: str = path_url,
+                  artifacts_dir: str = MODEL_ARTIFACTS_DIR):
+    """
+    Serve with several waitress worker processes accepting on one shared listening socket.
+    The parsed sensor arrays and fitted parameters are model artifacts that every worker memory-maps read-only,
+    so the operating system keeps one copy of them in the page cache: a worker costs a process, not another
+    copy of the dataset and models. The pandas/NumPy work of each request runs in parallel across workers.
+
+    SIGHUP restarts the workers (rebuilding stale artifacts first, e.g. after the CSV changed),
+    SIGTERM/SIGINT stops them. A worker that dies is replaced.
+    """
+    configure_logging()
+    ensure_columnar_beliefs(data_path)
+    ensure_model_artifacts(data_path, artifacts_dir)
+    sock = create_listening_socket(host, port)
+    children = {}
+    state = {'running': True, 'reload': False}
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app_factory, sock, threads)
+        children[pid] = time.monotonic()
+
+    def stop_children():
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def on_stop(signum, frame):
+        state['running'] = False
+        stop_children()
+
+    def on_reload(signum, frame):
+        state['reload'] = True
+        stop_children()
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    signal.signal(signal.SIGHUP, on_reload)
+
+    logger.info('Serving on %s:%s with %s worker processes', host, port, workers)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started_at = children.pop(pid, None)
+        if not state['running']:
+            continue
+        if started_at is not None and time.monotonic() - started_at < 1:
+            # Don't restart a crashing worker in a tight loop
+            time.sleep(1)
+        if state['reload'] and not children:
+            state['reload'] = False
+            ensure_columnar_beliefs(data_path)
+            ensure_model_artifacts(data_path, artifacts_dir)
+            for _ in range(workers):
+                spawn()
+        elif not state['reload']:
+            spawn()
+    sock.close()
@@ -0,0 +1,210 @@
+"""
+Many sites served from one process: the default dataset (path_url) plus every <site>.csv of SITES_DIR,
+selected on each endpoint with the 'site' query parameter.
+
+A site's data store (belief frame, nearest-observation indexes, model) is only loaded on its first request.
+Loaded sites are kept least recently used first, and once their estimated memory exceeds the budget the least
+recently used ones are unloaded, the pinned ones (the default site) excepted. An unloaded site is loaded again
+on its next request, from its columnar partitions and model artifacts when they were prepared.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import NamedTuple
+
+from my_weather_plugin.consts import path_url, DEFAULT_SITE, SITES_DIR, SITES_MEMORY_BUDGET_MB, ARTIFACTS_DIR, \
+    MODEL_ARTIFACTS_DIR
+from my_weather_plugin.data_store import WeatherDataStore
+from my_weather_plugin.helpers import UnknownSite
+from my_weather_plugin.metrics import metrics
+from my_weather_plugin.response_cache import ResponseCache
+
+
+class SiteConfig(NamedTuple):
+    """Where the data of a site and what is derived from it live."""
+    name: str
+    data_path: str
+    artifacts_dir: str
+    evaluation_dir: str
+    columnar_dir: str
+
+    @classmethod
+    def for_site(cls, name: str, data_path: str, artifacts_root: str = ARTIFACTS_DIR) -> 'SiteConfig':
+        """Configuration of a non-default site, its artifacts under artifacts_root/sites/<name>."""
+        site_dir = os.path.join(artifacts_root, 'sites', name)
+        return cls(name, data_path, os.path.join(site_dir, 'models'), site_dir, os.path.join(site_dir, 'columnar'))
+
+    def create_store(self) -> WeatherDataStore:
+        return WeatherDataStore(self.data_path, self.artifacts_dir, self.evaluation_dir, self.columnar_dir)
+
+
+def default_site_config(data_path: str = path_url, artifacts_dir: str = MODEL_ARTIFACTS_DIR,
+                        artifacts_root: str = ARTIFACTS_DIR) -> SiteConfig:
+    """Configuration of the default site, its model artifacts in artifacts_dir and the rest under artifacts_root."""
+    return SiteConfig(DEFAULT_SITE, data_path, artifacts_dir, artifacts_root, os.path.join(artifacts_root, 'columnar'))
+
+
+def discover_sites(sites_dir: str = SITES_DIR, data_path: str = path_url, artifacts_dir: str = MODEL_ARTIFACTS_DIR,
+                   artifacts_root: str = ARTIFACTS_DIR) -> dict:
+    """{site name: SiteConfig} of the default site and of every <site>.csv in sites_dir."""
+    sites = {DEFAULT_SITE: default_site_config(data_path, artifacts_dir, artifacts_root)}
+    if sites_dir and os.path.isdir(sites_dir):
+        for file_name in sorted(os.listdir(sites_dir)):
+            name, extension = os.path.splitext(file_name)
+            if extension == '.csv' and name != DEFAULT_SITE:
+                sites[name] = SiteConfig.for_site(name, os.path.join(sites_dir, file_name), artifacts_root)
+    return sites
+
+
+class Site:
+    """A loaded site: its data store and its response cache (own counters, backend shared by every site)."""
+    def __init__(self, config: SiteConfig, data_store, response_cache: ResponseCache):
+        self.config = config
+        self.data_store = data_store
+        self.response_cache = response_cache
+        self._memory_usage = (None, 0)
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    def memory_usage(self) -> int:
+        """The data store's estimate, only recomputed once its data, model or number of fitted models changed."""
+        data_store = self.data_store
+        state = (data_store.data_version, data_store.weather_data is not None,
+                 len(data_store.forecasting_model.fitted_models))
+        if self._memory_usage[0] != state:
+            self._memory_usage = (state, self.data_store.memory_usage())
+        return self._memory_usage[1]
+
+    def stats(self) -> dict:
+        return {
+            'memory_mb': round(self.memory_usage() / 2 ** 20, 1),
+            'model_cache': self.data_store.forecasting_model.fitted_models.stats(),
+            'response_cache': self.response_cache.stats(),
+        }
+
+
+class SiteRegistry:
+    """
+    The configured sites and the pool of loaded ones, bounded by memory_budget_mb (see the module docstring).
+    Safe to share between waitress threads: concurrent first requests of a site load it once (single-flight,
+    like FittedModelCache), the others waiting for the result.
+    The response caches of the loaded sites share the backend and ttl of response_cache.
+    """
+    def __init__(self, configs: dict, memory_budget_mb: float = SITES_MEMORY_BUDGET_MB,
+                 response_cache: ResponseCache = None, refresh_interval: float = 0, warm_up_models: bool = False):
+        self.configs = dict(configs)
+        self.memory_budget = int(memory_budget_mb * 2 ** 20)
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
+        self.refresh_interval = refresh_interval
+        self.warm_up_models = warm_up_models
+        self._sites = OrderedDict()
+        self._pinned = set()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def __contains__(self, name):
+        return name in self.configs
+
+    def loaded(self) -> list:
+        """The loaded sites, least recently used first."""
+        with self._lock:
+            return list(self._sites.values())
+
+    def add(self, site: Site, pinned: bool = True):
+        """Add an already loaded site, pinned ones are never unloaded."""
+        with self._lock:
+            self.configs[site.name] = site.config
+            self._sites[site.name] = site
+            if pinned:
+                self._pinned.add(site.name)
+
+    def get(self, name: str) -> Site:
+        """
+        Return the site, loading it first when it is not loaded, and mark it as the most recently used.
+        Sites grow after their load (models are fitted on demand), so the budget is enforced on every call.
+        """
+        with self._lock:
+            site = self._sites.get(name)
+            if site is not None:
+                self._sites.move_to_end(name)
+        if site is not None:
+            self.evict(keep=name)
+            return site
+        with self._lock:
+            if name in self._sites:
+                return self._sites[name]
+            if name not in self.configs:
+                raise UnknownSite(f'Unknown site {name!r}')
+            in_flight = self._in_flight.get(name)
+            owner = in_flight is None
+            if owner:
+                in_flight = self._in_flight[name] = Future()
+
+        if not owner:
+            return in_flight.result()
+
+        try:
+            site = self._load(self.configs[name])
+        except BaseException as error:
+            with self._lock:
+                del self._in_flight[name]
+            in_flight.set_exception(error)
+            raise
+
+        with self._lock:
+            del self._in_flight[name]
+            self._sites[name] = site
+            self.loads += 1
+        metrics.increment('weather_site_loads_total', site=name)
+        self.evict(keep=name)
+        in_flight.set_result(site)
+        return site
+
+    def _load(self, config: SiteConfig) -> Site:
+        data_store = config.create_store()
+        if self.warm_up_models:
+            data_store.forecasting_model.warm_up()
+        if self.refresh_interval:
+            data_store.watch(self.refresh_interval)
+        return Site(config, data_store, ResponseCache(self.response_cache.backend, self.response_cache.ttl))
+
+    def evict(self, keep: str = None) -> list:
+        """
+        Unload least recently used sites (neither pinned nor keep) while the loaded ones exceed the memory budget.
+        Returns the names of the unloaded sites.
+        """
+        with self._lock:
+            sites = list(self._sites.values())
+        usage = {site.name: site.memory_usage() for site in sites}
+        total = sum(usage.values())
+        evicted = []
+        with self._lock:
+            for name in list(self._sites):
+                if total <= self.memory_budget:
+                    break
+                if name in self._pinned or name == keep or name not in usage:
+                    continue
+                site = self._sites.pop(name)
+                site.data_store.stop_watching()
+                total -= usage[name]
+                evicted.append(name)
+            self.evictions += len(evicted)
+        for name in evicted:
+            metrics.increment('weather_site_evictions_total', site=name)
+        return evicted
+
+    def stats(self) -> dict:
+        sites = self.loaded()
+        return {
+            'configured': len(self.configs),
+            'loaded': [site.name for site in sites],
+            'memory_mb': round(sum(site.memory_usage() for site in sites) / 2 ** 20, 1),
+            'memory_budget_mb': round(self.memory_budget / 2 ** 20, 1),
+            'loads': self.loads,
+            'evictions': self.evictions,
+        }
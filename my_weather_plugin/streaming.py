@@ -0,0 +1,148 @@
+"""
+Streamed tabular responses, for outputs too large to build as one dict and one JSON body.
+
+A table is a schema, [(column, NumPy dtype)], and an iterable of chunks, {column: array}, produced lazily
+(e.g. by the forecasting loop). Each chunk is serialized and compressed as soon as it is produced, so the
+first bytes leave before the last rows are computed and memory is bounded by the chunk size.
+The format follows the Accept header:
+- application/x-ndjson: one JSON object per row (datetimes as ISO strings).
+- application/x-npy: one .npy structured array per chunk, read back with repeated numpy.load on the stream.
+- application/vnd.apache.arrow.stream: an Arrow IPC stream with one record batch per chunk (needs pyarrow).
+"""
+import io
+import json
+import logging
+import zlib
+
+import numpy as np
+from flask import Response, g, request
+
+from my_weather_plugin.consts import STREAM_GZIP_LEVEL, DEFAULT_SITE
+from my_weather_plugin.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+NDJSON = 'application/x-ndjson'
+NPY = 'application/x-npy'
+ARROW = 'application/vnd.apache.arrow.stream'
+
+
+def arrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate_format(offers) -> str:
+    """The offered mimetype the client's Accept header prefers, the first offer on ties or without Accept."""
+    offers = [offer for offer in offers if offer != ARROW or arrow_available()]
+    return request.accept_mimetypes.best_match(offers, default=offers[0])
+
+
+def _json_column(values: np.ndarray) -> list:
+    if np.issubdtype(values.dtype, np.datetime64):
+        return np.datetime_as_string(values, unit='s', timezone='UTC').tolist()
+    if values.dtype.kind == 'f':
+        return np.where(np.isnan(values), None, values).tolist()
+    return values.tolist()
+
+
+def ndjson_chunks(schema, chunks):
+    names = [name for name, _ in schema]
+    for chunk in chunks:
+        columns = [_json_column(np.asarray(chunk[name])) for name in names]
+        yield ''.join(json.dumps(dict(zip(names, row))) + '\n' for row in zip(*columns)).encode()
+
+
+def npy_chunks(schema, chunks):
+    dtype = np.dtype([(name, column_dtype) for name, column_dtype in schema])
+    for chunk in chunks:
+        length = len(chunk[schema[0][0]])
+        rows = np.empty(length, dtype=dtype)
+        for name, _ in schema:
+            rows[name] = chunk[name]
+        buffer = io.BytesIO()
+        np.save(buffer, rows)
+        yield buffer.getvalue()
+
+
+def arrow_chunks(schema, chunks):
+    import pyarrow as pa
+
+    def arrow_type(column_dtype):
+        column_dtype = np.dtype(column_dtype)
+        if np.issubdtype(column_dtype, np.datetime64):
+            return pa.timestamp('ns', tz='UTC')
+        if column_dtype.kind == 'U':
+            return pa.string()
+        return pa.from_numpy_dtype(column_dtype)
+
+    arrow_schema = pa.schema([(name, arrow_type(column_dtype)) for name, column_dtype in schema])
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, arrow_schema)
+
+    def drain() -> bytes:
+        content = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return content
+
+    for chunk in chunks:
+        columns = []
+        for name, column_dtype in schema:
+            values = np.asarray(chunk[name])
+            if np.issubdtype(values.dtype, np.datetime64):
+                values = values.astype('datetime64[ns]').view('int64')
+            columns.append(pa.array(values, type=arrow_schema.field(name).type))
+        writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=arrow_schema))
+        yield drain()
+    writer.close()
+    yield drain()
+
+
+SERIALIZERS = {NDJSON: ndjson_chunks, NPY: npy_chunks, ARROW: arrow_chunks}
+
+
+def gzip_chunks(chunks, level: int = STREAM_GZIP_LEVEL):
+    """Gzip a stream chunk by chunk, flushing after each so the client can decode what was sent so far."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def reported_errors(chunks, endpoint: str, site: str = DEFAULT_SITE):
+    """
+    Log and count an error raised while a body is produced, then let it cut the stream off: the view returned
+    before, so handle_request_errors does not see it.
+    """
+    try:
+        yield from chunks
+    except Exception:
+        logger.exception('Error while streaming the %s response', endpoint)
+        metrics.increment('weather_stream_errors_total', endpoint=endpoint, site=site)
+        raise
+
+
+def stream_response(body_chunks, mimetype: str) -> Response:
+    """
+    Response streaming the given byte chunks, gzipped on the fly when the client accepts it.
+    direct_passthrough keeps flask_compress from buffering the whole body to compress it again.
+    """
+    body_chunks = reported_errors(body_chunks, request.endpoint, g.get('site', DEFAULT_SITE))
+    headers = {'Vary': 'Accept-Encoding'}
+    if 'gzip' in request.accept_encodings:
+        body_chunks = gzip_chunks(body_chunks)
+        headers['Content-Encoding'] = 'gzip'
+    response = Response(body_chunks, mimetype=mimetype, headers=headers)
+    response.direct_passthrough = True
+    return response
+
+
+def stream_table(schema, chunks, mimetype: str) -> Response:
+    """Stream a table (see the module docstring) in the given format, one serialized chunk at a time."""
+    return stream_response(SERIALIZERS[mimetype](schema, chunks), mimetype)
@@ -2,6 +2,21 @@ import pytest
 from flask import testing
 
 from main import create_app
+from my_weather_plugin.tests.synthetic import generate_weather_csv
+
+
+@pytest.fixture(scope='session')
+def synthetic_weather_csv(tmp_path_factory):
+    """Factory returning the path of a synthetic belief CSV with this many rows, generated once per session."""
+    paths = {}
+
+    def make(rows: int, seed: int = 0) -> str:
+        if (rows, seed) not in paths:
+            paths[rows, seed] = generate_weather_csv(
+                tmp_path_factory.mktemp('synthetic') / f'weather_{rows}_{seed}.csv', rows, seed)
+        return paths[rows, seed]
+
+    return make
 
 
 @pytest.fixture()
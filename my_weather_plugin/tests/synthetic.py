@@ -0,0 +1,44 @@
+"""Synthetic belief data in the layout of the real dataset, for tests and benchmarks."""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from my_weather_plugin.consts import CSV_COLUMNS, MAX_FORECAST_HORIZON, target_variables
+
+BELIEFS_PER_EVENT = 4
+
+
+def generate_weather_csv(path, rows: int, seed: int = 0, end: datetime = None, chunk_rows: int = 1_000_000) -> str:
+    """
+    Write a synthetic belief CSV of `rows` rows in the layout of the real dataset: hourly events ending at `end`
+    (default the current hour), the three sensors, and BELIEFS_PER_EVENT beliefs per event and sensor with
+    random horizons up to MAX_FORECAST_HORIZON hours. Values follow a daily cycle plus noise.
+    Written in chunks, so 10M rows never sit in memory as strings at once.
+    """
+    rng = np.random.default_rng(seed)
+    rows_per_event = len(target_variables) * BELIEFS_PER_EVENT
+    events = -(-rows // rows_per_event)
+    end = pd.Timestamp(end or datetime.utcnow()).floor('H').tz_localize(None)
+    first_event = (end - pd.Timedelta(hours=events - 1)).tz_localize('UTC')
+
+    with open(path, 'w') as file:
+        file.write(','.join(CSV_COLUMNS) + '\n')
+        for chunk_start in range(0, rows, chunk_rows):
+            row = np.arange(chunk_start, min(chunk_start + chunk_rows, rows))
+            event = row // rows_per_event
+            sensor = (row // BELIEFS_PER_EVENT) % len(target_variables)
+            event_start = first_event + pd.to_timedelta(event, unit='h')
+            daily_cycle = np.sin(2 * np.pi * (event_start.hour.to_numpy() - 6) / 24)
+            noise = rng.normal(size=len(row))
+            values = np.select(
+                [sensor == 0, sensor == 1],
+                [12 + 6 * daily_cycle + noise, np.maximum(0, 500 * daily_cycle + 50 * noise)],
+                np.abs(5 + 2 * noise))
+            pd.DataFrame({
+                'event_start': event_start,
+                'belief_horizon_in_sec': rng.integers(0, MAX_FORECAST_HORIZON + 1, len(row)) * 3600,
+                'event_value': values.round(2),
+                'sensor': np.asarray(target_variables)[sensor],
+            }, columns=CSV_COLUMNS).to_csv(file, header=False, index=False)
+    return str(path)
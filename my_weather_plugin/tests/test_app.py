@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from flask import json
 
 
@@ -64,3 +65,107 @@ def test_valid_lag(client):
     data = response.json
     assert 'rmse_values' in data
     assert 'percentage_accuracy' in data
+
+
+def test_forecasts_reuse_cached_models(client, app):
+    """A second forecast with the same lag should be served from the model cache without refitting."""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    then = (datetime.now() + timedelta(hours=6)).strftime('%Y-%m-%d %H:%M:%S')
+    # Another 'now' with the same lag, so the response cache does not answer the second request
+    other_now = (datetime.now() - timedelta(hours=5)).strftime('%Y-%m-%d %H:%M:%S')
+    other_then = (datetime.now() + timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
+    model_cache = app.extensions['forecasting_model'].fitted_models
+
+    client.get(f'/forecasts?now={now}&then={then}')
+    misses = model_cache.misses
+    response = client.get(f'/forecasts?now={other_now}&then={other_then}')
+
+    assert response.status_code == 200
+    assert model_cache.misses == misses
+    assert model_cache.hits >= 3
+
+
+def test_concurrent_forecasts_with_different_lags(app):
+    """Concurrent forecasts for different lags should each get their own lag's answer."""
+    now = datetime.now()
+    lags = [1, 6, 12, 24, 36, 48] * 4
+
+    def forecast(lag):
+        then = now + timedelta(hours=lag)
+        response = app.test_client().get(f"/forecasts?now={now.strftime('%Y-%m-%d %H:%M:%S')}"
+                                         f"&then={then.strftime('%Y-%m-%d %H:%M:%S')}")
+        return lag, response.status_code, response.json
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        concurrent_results = list(executor.map(forecast, lags))
+    sequential_results = {lag: forecast(lag)[2] for lag in set(lags)}
+
+    for lag, status_code, data in concurrent_results:
+        assert status_code == 200
+        assert data == sequential_results[lag]
+    assert app.extensions['forecasting_model'].fitted_models.misses == 3 * len(set(lags))
+
+
+def test_forecasts_batch_matches_single_forecasts(client):
+    """Batch forecasts should equal the single /forecasts answers and keep the order of the pairs."""
+    now = datetime.now()
+    pairs = [{'now': (now - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S'),
+              'then': (now - timedelta(hours=hours) + timedelta(hours=lag)).strftime('%Y-%m-%d %H:%M:%S')}
+             for hours, lag in [(0, 24), (5, 3), (10, 24), (3, 48)]]
+
+    response = client.post('/forecasts/batch', json={'pairs': pairs})
+
+    assert response.status_code == 200
+    forecasts = response.json['forecasts']
+    assert [(forecast['now'], forecast['then']) for forecast in forecasts] == [(p['now'], p['then']) for p in pairs]
+    for pair, forecast in zip(pairs, forecasts):
+        single = client.get(f"/forecasts?now={pair['now']}&then={pair['then']}").json
+        for variable, value in single.items():
+            assert abs(forecast[variable] - value) < 1e-6
+
+
+def test_forecasts_batch_invalid_requests(client):
+    """Missing pairs, bad dates and out of range horizons are rejected with 400."""
+    now = datetime.now()
+    too_far = (now + timedelta(hours=49)).strftime('%Y-%m-%d %H:%M:%S')
+    assert client.post('/forecasts/batch', json={}).status_code == 400
+    assert client.post('/forecasts/batch', json={'pairs': [{'now': 'yesterday', 'then': 'today'}]}).status_code == 400
+    assert client.post('/forecasts/batch', json=[
+        {'now': now.strftime('%Y-%m-%d %H:%M:%S'), 'then': too_far}]).status_code == 400
+
+
+def test_forecasts_curve_endpoint(client):
+    """The curve covers horizons 1..48 and agrees with the single /forecasts answer at each horizon checked."""
+    now = datetime.now()
+    response = client.get(f"/forecasts/curve?now={now.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    assert response.status_code == 200
+    curve = response.json
+    assert len(curve['timestamps']) == 48
+    for lag in (1, 24, 48):
+        then = curve['timestamps'][lag - 1]
+        single = client.get(f"/forecasts?now={now.strftime('%Y-%m-%d %H:%M:%S')}&then={then}").json
+        for variable, value in single.items():
+            assert abs(curve[variable][lag - 1] - value) < 1e-6
+
+
+def test_forecasts_curve_missing_parameters(client):
+    """The curve endpoint without 'now' should return error 400."""
+    assert client.get('/forecasts/curve').status_code == 400
+
+
+def test_forecasts_are_served_from_the_response_cache(client, app):
+    """Requests resolving to the same observations and lag share one cached response."""
+    now = datetime.now().replace(minute=0, second=0)
+    response_cache = app.extensions['response_cache']
+    query = '/forecasts?now={}&then={}'
+
+    first = client.get(query.format(now.strftime('%Y-%m-%d %H:%M:%S'),
+                                    (now + timedelta(hours=3)).strftime('%Y-%m-%d %H:%M:%S')))
+    second = client.get(query.format((now + timedelta(minutes=5)).strftime('%Y-%m-%d %H:%M:%S'),
+                                     (now + timedelta(hours=3, minutes=5)).strftime('%Y-%m-%d %H:%M:%S')))
+
+    assert first.json == second.json
+    assert response_cache.stats()['misses'] == 1
+    assert response_cache.stats()['hits'] == 1
+    assert client.get('/').json['response_cache']['hits'] == 1
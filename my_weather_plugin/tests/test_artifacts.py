@@ -0,0 +1,38 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from main import create_app
+from my_weather_plugin.artifacts import build_model_artifacts, ModelArtifacts, ArtifactForecastModel
+from my_weather_plugin.consts import path_url
+
+
+def test_app_serves_from_model_artifacts(tmp_path, client):
+    """With fresh artifacts the app forecasts from the stored parameters, with the same answers as training."""
+    build_model_artifacts(directory=str(tmp_path), lags=[1, 24])
+    artifact_app = create_app(artifacts_dir=str(tmp_path))
+    assert isinstance(artifact_app.extensions['forecasting_model'], ArtifactForecastModel)
+
+    now = datetime.now()
+    for lag in (1, 24):
+        query = f"now={now.strftime('%Y-%m-%d %H:%M:%S')}" \
+                f"&then={(now + timedelta(hours=lag)).strftime('%Y-%m-%d %H:%M:%S')}"
+        expected = client.get(f'/forecasts?{query}').json
+        served = artifact_app.test_client().get(f'/forecasts?{query}').json
+        for variable, value in expected.items():
+            assert abs(served[variable] - value) < 1e-6
+
+
+def test_stale_model_artifacts_are_ignored(tmp_path):
+    """Artifacts built on other data are not loaded, so the app falls back to training."""
+    build_model_artifacts(directory=str(tmp_path), lags=[1])
+    assert ModelArtifacts.load(path_url, str(tmp_path)) is not None
+
+    metadata_path = os.path.join(str(tmp_path), 'metadata.json')
+    with open(metadata_path) as file:
+        metadata = json.load(file)
+    metadata.update(fingerprint='other', data_size=-1)
+    with open(metadata_path, 'w') as file:
+        json.dump(metadata, file)
+
+    assert ModelArtifacts.load(path_url, str(tmp_path)) is None
@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+
+from my_weather_plugin.backtest import walk_origins, origin_grid, BacktestResult, HOUR
+
+
+def linear_rows(hours: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    times = np.arange(hours, dtype=np.int64) * HOUR
+    x = rng.normal(size=(hours, 3))
+    return times, x, x @ np.array([0.5, -2.0, 1.5])
+
+
+def test_origin_grids_of_every_horizon_line_up():
+    day = 24 * HOUR
+    assert origin_grid(5 * HOUR, 10 * day, 24, 48).tolist() == [day * days for days in range(3, 11)]
+    assert origin_grid(7 * HOUR, 10 * day, 24, 48)[0] == 3 * day
+
+
+def test_exactly_linear_data_is_forecast_without_error():
+    """Expanding and sliding windows recover a noise free linear relation at every origin."""
+    times, x, y = linear_rows(24 * 30)
+    origins = origin_grid(times[0], times[-1], 24, 7 * 24)
+    for window in (None, 5 * 24):
+        rmse, mae, counts = walk_origins(times, x, y, 6, origins, 24, window)
+        forecast = counts > 0
+        assert forecast.any()
+        assert np.allclose(rmse[forecast], 0, atol=1e-6)
+        assert np.allclose(mae[forecast], 0, atol=1e-6)
+
+
+def test_sliding_window_forgets_old_regimes():
+    """After the relation changes, a sliding window adapts while an expanding window keeps the old rows."""
+    times, x, y = linear_rows(24 * 40)
+    y[: 24 * 20] = x[: 24 * 20] @ np.array([3.0, 1.0, -1.0])
+    origins = origin_grid(times[0], times[-1], 24, 7 * 24)
+
+    expanding, _, _ = walk_origins(times, x, y, 1, origins, 24)
+    sliding, _, _ = walk_origins(times, x, y, 1, origins, 24, window=5 * 24)
+
+    assert sliding[-5:].max() < 1e-6 < expanding[-5:].min()
+
+
+def test_backtest_endpoint_streams_one_line_per_horizon_and_variable(client):
+    response = client.get('/backtest?horizons=1,24&variables=temperature,irradiance&step=168')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted((line['horizon'], line['variable']) for line in lines) == [
+        (1, 'irradiance'), (1, 'temperature'), (24, 'irradiance'), (24, 'temperature')]
+    assert all(len(line['origins']) == len(line['rmse']) == len(line['mae']) for line in lines)
+
+    def parsed(line):
+        origins = np.array([origin.rstrip('Z') for origin in line['origins']], dtype='datetime64[ns]')
+        return dict(line, origins=origins.view('int64'), rmse=np.array(line['rmse'], dtype=float),
+                    mae=np.array(line['mae'], dtype=float))
+
+    backtest = BacktestResult.collect([parsed(line) for line in lines], [1, 24], ['temperature', 'irradiance'])
+    assert backtest.rmse.shape == (len(backtest.origins), 2, 2)
+
+
+def test_backtest_endpoint_rejects_invalid_parameters(client):
+    assert client.get('/backtest?horizons=0').status_code == 400
+    assert client.get('/backtest?variables=humidity').status_code == 400
+    assert client.get('/backtest?step=daily').status_code == 400
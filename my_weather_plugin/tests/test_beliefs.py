@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from my_weather_plugin.beliefs import latest_belief_positions, latest_beliefs
+from my_weather_plugin.consts import target_variables
+from my_weather_plugin.helpers import read_weather_data
+
+
+def sort_and_drop_duplicates(weather_data: pd.DataFrame, sensor: str) -> pd.Series:
+    """The double sort the kernel replaces, as a reference."""
+    beliefs = (weather_data[weather_data['sensor'] == sensor]
+               .sort_values(by=['belief_horizon_in_sec'], kind='stable')
+               .drop_duplicates(subset=['event_start'], keep='first')
+               .sort_values(by=['event_start']))
+    return pd.Series(beliefs['event_value'].to_numpy(), index=pd.DatetimeIndex(beliefs['event_start']))
+
+
+def test_latest_beliefs_match_the_double_sort():
+    weather_data = read_weather_data()
+    beliefs = latest_beliefs(weather_data)
+    for sensor in target_variables:
+        expected = sort_and_drop_duplicates(weather_data, sensor)
+        assert (beliefs[sensor].index == expected.index).all()
+        assert np.array_equal(beliefs[sensor].to_numpy(), expected.to_numpy(), equal_nan=True)
+
+
+def test_kernel_keeps_the_smallest_horizon_per_sensor_and_event():
+    hour = 3600 * 10 ** 9
+    sensors = np.array([1, 0, 0, 1, 0, 0], dtype=np.int8)
+    event_starts = np.array([0, 0, 0, 0, hour, hour])
+    horizons = np.array([60, 7200, 3600, 30, 3600, 3600])
+
+    assert latest_belief_positions(sensors, event_starts, horizons).tolist() == [2, 4, 3]
+
+
+def test_as_of_ignores_beliefs_formed_later():
+    """As of an hour before the event, only the belief formed two hours ahead was known."""
+    hour = 3600 * 10 ** 9
+    sensors = np.zeros(2, dtype=np.int8)
+    event_starts = np.array([10 * hour, 10 * hour])
+    horizons = np.array([7200, 600])
+
+    assert latest_belief_positions(sensors, event_starts, horizons).tolist() == [1]
+    assert latest_belief_positions(sensors, event_starts, horizons, as_of=9 * hour).tolist() == [0]
+    assert latest_belief_positions(sensors, event_starts, horizons, as_of=7 * hour).tolist() == []
@@ -0,0 +1,106 @@
+"""
+Benchmarks of startup, per-endpoint latency and peak memory as the dataset grows, on synthetic data.
+
+    pytest my_weather_plugin/tests --benchmark --benchmark-rows 10000 100000 1000000 10000000
+
+Each dataset size is measured in a fresh interpreter (my_weather_plugin/benchmark.py). The results are written
+as JSON (--benchmark-output), tagged with the commit, to be compared across commits.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+import pytest
+
+from my_weather_plugin.benchmark import BENCHMARK_ENDPOINTS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+@pytest.fixture(scope='module')
+def benchmark_results(request):
+    """Results collected by the benchmarks of this module, written to --benchmark-output at the end."""
+    results = []
+    yield results
+    if results:
+        with open(request.config.getoption('--benchmark-output', 'benchmark_results.json'), 'w') as file:
+            json.dump({
+                'commit': current_commit(),
+                'date': datetime.utcnow().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'cpu_count': os.cpu_count(),
+                'results': results,
+            }, file, indent=2)
+
+
+@pytest.mark.benchmark
+def test_benchmark_dataset_sizes(request, synthetic_weather_csv, benchmark_results):
+    """Startup, latency and peak RSS per dataset size."""
+    requests = request.config.getoption('--benchmark-requests', 100)
+    for rows in sorted(request.config.getoption('--benchmark-rows', [10_000])):
+        data_path = synthetic_weather_csv(rows)
+        output = subprocess.run(
+            [sys.executable, '-m', 'my_weather_plugin.benchmark', data_path, '--requests', str(requests)],
+            cwd=ROOT, check=True, capture_output=True, text=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        benchmark_results.append(result)
+
+        print(f"rows={rows:>10,}  startup={result['startup_s']:.2f}s  peak_rss={result['peak_rss_mb']:.0f}MB")
+        for endpoint, measurement in result['endpoints'].items():
+            print(f"    {endpoint:<24} p50={measurement['p50_ms']:8.1f}ms  p99={measurement['p99_ms']:8.1f}ms  "
+                  f"{measurement['throughput']:8.1f} req/s")
+
+        assert result['rows'] == rows
+        assert set(result['endpoints']) == set(BENCHMARK_ENDPOINTS)
+
+
+@pytest.mark.benchmark
+def test_benchmark_site_pool_memory_stays_bounded(synthetic_weather_csv, tmp_path, benchmark_results):
+    """120 sites requested twice each under a 16MB budget: never more than the budget (plus the site just
+    loaded) is held, so sites are unloaded and loaded again rather than piling up."""
+    from my_weather_plugin.tests.synthetic import generate_weather_csv
+
+    sites_dir = tmp_path / 'sites'
+    sites_dir.mkdir()
+    for site in range(120):
+        generate_weather_csv(sites_dir / f'site_{site:03d}.csv', 5_000, seed=site)
+    output = subprocess.run(
+        [sys.executable, '-m', 'my_weather_plugin.benchmark', synthetic_weather_csv(5_000),
+         '--sites-dir', str(sites_dir), '--memory-budget', '16', '--rounds', '2'],
+        cwd=ROOT, check=True, capture_output=True, text=True)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    benchmark_results.append(result)
+
+    print(f"sites={result['sites']}  max_loaded={result['max_loaded_sites']}  "
+          f"max_memory={result['max_sites_memory_mb']:.1f}MB  evictions={result['evictions']}  "
+          f"peak_rss={result['peak_rss_mb']:.0f}MB  cold_p50={result['cold']['p50_ms']:.1f}ms")
+
+    assert result['sites'] == 120
+    assert result['max_loaded_sites'] < result['sites']
+    assert result['evictions'] > 0
+    assert result['max_sites_memory_mb'] <= result['memory_budget_mb'] + result['max_site_memory_mb']
+
+
+def test_synthetic_weather_csv_layout(synthetic_weather_csv):
+    """The generated data has the real dataset's columns, the three sensors and horizons up to 48h."""
+    from my_weather_plugin.consts import CSV_COLUMNS, MAX_FORECAST_HORIZON, target_variables
+    from my_weather_plugin.helpers import read_weather_data
+
+    weather_data = read_weather_data(path=synthetic_weather_csv(10_000))
+
+    assert len(weather_data) == 10_000
+    assert set(weather_data.columns) == set(CSV_COLUMNS)
+    assert set(weather_data['sensor']) == set(target_variables)
+    assert weather_data['belief_horizon_in_sec'].between(0, MAX_FORECAST_HORIZON * 3600).all()
+    assert str(weather_data['event_start'].dt.tz) == 'UTC'
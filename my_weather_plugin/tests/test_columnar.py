@@ -0,0 +1,72 @@
+import shutil
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from my_weather_plugin.beliefs import latest_beliefs
+from my_weather_plugin.columnar import convert_to_columnar, ColumnarBeliefs
+from my_weather_plugin.consts import path_url, target_variables
+from my_weather_plugin.data_store import WeatherDataStore
+from my_weather_plugin.helpers import get_transformed_data_frames, read_weather_data, get_nearst_values_to_now, \
+    NearestValueIndex
+from my_weather_plugin.tests.test_data_store import append_rows
+
+
+def test_columnar_frames_match_the_csv(tmp_path):
+    """The mapped sensor frames have the CSV's times and horizons, and its values at float32 precision."""
+    columnar = ColumnarBeliefs.load(path_url, convert_to_columnar(directory=str(tmp_path)))
+    assert columnar is not None
+    assert isinstance(columnar.partitions[0].columns['event_value'], np.memmap)
+
+    for from_csv, mapped in zip(get_transformed_data_frames(weather_data=read_weather_data()),
+                                get_transformed_data_frames(columnar=columnar)):
+        assert (from_csv['exact_time'].to_numpy() == mapped['exact_time'].to_numpy()).all()
+        assert (from_csv['belief_horizon_in_sec'].to_numpy() == mapped['belief_horizon_in_sec'].to_numpy()).all()
+        assert np.allclose(from_csv['event_value'].to_numpy(), mapped['event_value'].to_numpy(), rtol=1e-6)
+        assert 'sensor' not in mapped
+
+
+def test_columnar_sensor_indexes_find_the_same_observations(tmp_path):
+    columnar = ColumnarBeliefs.load(path_url, convert_to_columnar(directory=str(tmp_path)))
+    from_csv = [NearestValueIndex(table) for table in get_transformed_data_frames(weather_data=read_weather_data())]
+    mapped = columnar.sensor_indexes()
+
+    for hours in (0, 7, 100, 1000):
+        now = datetime.now() - timedelta(hours=hours)
+        expected, served = get_nearst_values_to_now(*from_csv, now), get_nearst_values_to_now(*mapped, now)
+        for variable, value in expected.items():
+            assert abs(served[variable] - value) <= 1e-6 * max(abs(value), 1)
+
+
+def test_hourly_series_from_the_mapped_columns_match_the_csv(tmp_path):
+    columnar = ColumnarBeliefs.load(path_url, convert_to_columnar(directory=str(tmp_path)))
+
+    from_csv, mapped = latest_beliefs(read_weather_data()), latest_beliefs(None, columnar=columnar)
+    for sensor in target_variables:
+        assert (from_csv[sensor].index == mapped[sensor].index).all()
+        assert np.allclose(from_csv[sensor].to_numpy(), mapped[sensor].to_numpy(), rtol=1e-6)
+
+
+def test_store_loads_from_columnar_and_refreshes_appended_rows(tmp_path):
+    """
+    A store on a converted dataset maps it without holding a belief frame, under its own data version, and
+    still ingests rows appended to the CSV afterwards.
+    """
+    data_path = str(tmp_path / 'weather.csv')
+    shutil.copy(path_url, data_path)
+    columnar_dir = convert_to_columnar(data_path, str(tmp_path / 'columnar'))
+    store = WeatherDataStore(data_path, artifacts_dir=str(tmp_path / 'no_artifacts'), columnar_dir=columnar_dir)
+    csv_store = WeatherDataStore(data_path, artifacts_dir=str(tmp_path / 'no_artifacts'), columnar_dir=None)
+    fingerprint = store.fingerprint
+    assert len(store.weather_data) == 0
+    assert store.rows == len(csv_store.weather_data)
+    assert store.data_version != csv_store.data_version
+
+    last_event = csv_store.weather_data['event_start'].max() + timedelta(hours=1)
+    store.forecasting_model.warm_up(lags=[1])
+    append_rows(store, [(last_event.strftime('%Y-%m-%d %H:%M:%S+00:00'), 3600, 12.5, 'temperature')])
+
+    assert store.refresh()['new_rows'] == 1
+    assert store.fingerprint != fingerprint
+    assert store.forecasting_model.series.temperature_series[last_event] == 12.5
+    assert ColumnarBeliefs.load(data_path, columnar_dir) is None
@@ -0,0 +1,96 @@
+import shutil
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from my_weather_plugin.artifacts import build_model_artifacts, ArtifactForecastModel
+from my_weather_plugin.consts import path_url
+from my_weather_plugin.data_store import WeatherDataStore
+from my_weather_plugin.evaluation import dataset_fingerprint
+from my_weather_plugin.forecasting import LazyForecastModel
+
+
+def make_store(tmp_path) -> WeatherDataStore:
+    """Store on a copy of the dataset, without model artifacts."""
+    data_path = tmp_path / 'weather.csv'
+    shutil.copy(path_url, data_path)
+    return WeatherDataStore(str(data_path), artifacts_dir=str(tmp_path / 'no_artifacts'))
+
+
+def append_rows(store, rows):
+    """Append (event_start, horizon, value, sensor) beliefs to the store's CSV, in its column order."""
+    with open(store.data_path, 'a') as file:
+        for event_start, horizon, value, sensor in rows:
+            row = {'event_start': event_start, 'belief_horizon_in_sec': horizon, 'event_value': value,
+                   'sensor': sensor}
+            file.write(','.join(str(row.get(column, '')) for column in store.columns) + '\n')
+
+
+def test_refresh_ingests_only_appended_rows(tmp_path):
+    """Appended beliefs are parsed on refresh and added to the frame and sensor indexes."""
+    store = make_store(tmp_path)
+    rows_before = len(store.weather_data)
+    temperature_before = len(store.sensor_indexes[0])
+    last_event = store.weather_data['event_start'].max() + timedelta(hours=1)
+
+    append_rows(store, [(last_event.strftime('%Y-%m-%d %H:%M:%S+00:00'), 3600, 12.5, 'temperature')])
+    result = store.refresh()
+
+    assert result['new_rows'] == 1
+    assert len(store.weather_data) == rows_before + 1
+    assert len(store.sensor_indexes[0]) == temperature_before + 1
+    assert store.fingerprint == dataset_fingerprint(store.data_path)
+    assert store.refresh()['new_rows'] == 0
+
+
+def test_refresh_keeps_models_whose_training_window_did_not_change(tmp_path):
+    """A corrected belief at the end of the data only invalidates models trained on that period."""
+    store = make_store(tmp_path)
+    model = store.forecasting_model
+    model.train_models(1)
+    data_version = model.data_version
+
+    last_event = pd.Timestamp(model.temperature_series.index[-1])
+    append_rows(store, [(last_event.strftime('%Y-%m-%d %H:%M:%S+00:00'), -3600, 99.0, 'temperature')])
+    store.refresh()
+
+    assert model.data_version == data_version + 1
+    assert model.temperature_series.iloc[-1] == 99.0
+    assert ('temperature', 1) in model.fitted_models
+
+
+def test_refresh_keeps_model_artifacts_until_beliefs_are_appended(tmp_path):
+    """Appended beliefs are merged into the mapped sensor indexes, without reading the CSV they were built on."""
+    data_path = tmp_path / 'weather.csv'
+    shutil.copy(path_url, data_path)
+    build_model_artifacts(str(data_path), str(tmp_path / 'models'), lags=[1])
+    store = WeatherDataStore(str(data_path), artifacts_dir=str(tmp_path / 'models'), columnar_dir=None)
+    data_version = store.data_version
+
+    assert store.refresh() == {'new_rows': 0, 'invalidated_models': 0, 'data_version': data_version}
+    assert isinstance(store.forecasting_model, ArtifactForecastModel)
+
+    temperature_before = len(store.sensor_indexes[0])
+    last_event = pd.Timestamp(store.sensor_indexes[0].times[-1], tz='UTC') + timedelta(hours=1)
+    append_rows(store, [(last_event.strftime('%Y-%m-%d %H:%M:%S+00:00'), 3600, 12.5, 'temperature')])
+    result = store.refresh()
+
+    assert result['new_rows'] == 1
+    assert store.weather_data is None
+    assert len(store.sensor_indexes[0]) == temperature_before + 1
+    assert store.fingerprint == dataset_fingerprint(store.data_path) != data_version
+    assert isinstance(store.forecasting_model, LazyForecastModel)
+    store.forecasting_model.train_models(1)
+    assert store.weather_data['event_value'].iloc[-1] == 12.5
+    assert len(store.sensor_indexes[0]) == temperature_before + 1
+
+
+def test_admin_refresh_endpoint(client, monkeypatch):
+    """The admin endpoint refreshes the data store and reports what changed, for the configured token only."""
+    assert client.post('/admin/refresh').status_code == 403
+    monkeypatch.setattr('my_weather_plugin.helpers.ADMIN_TOKEN', 'secret')
+    assert client.post('/admin/refresh', headers={'X-Admin-Token': 'other'}).status_code == 403
+
+    response = client.post('/admin/refresh', headers={'X-Admin-Token': 'secret'})
+    assert response.status_code == 200
+    assert response.json['new_rows'] == 0
@@ -0,0 +1,54 @@
+import json
+
+from my_weather_plugin.evaluation import EvaluationTable, dataset_fingerprint
+
+EVALUATION = {'rmse_values': {'temperature': 1.5}, 'percentage_accuracy': {'temperature': 90.0}}
+
+
+def test_evaluation_table_round_trip(tmp_path):
+    """A saved table loads back for the same fingerprint only."""
+    table = EvaluationTable('abc', {24: EVALUATION})
+    table.save(str(tmp_path))
+
+    assert EvaluationTable.load('abc', str(tmp_path)).lags == {24: EVALUATION}
+    assert EvaluationTable.load('other', str(tmp_path)).lags == {}
+
+
+def test_evaluation_table_ignores_other_versions(tmp_path):
+    """Artifacts written by another table version are recomputed."""
+    path = EvaluationTable.path_for('abc', str(tmp_path))
+    with open(path, 'w') as file:
+        json.dump({'version': -1, 'fingerprint': 'abc', 'lags': {'24': EVALUATION}}, file)
+    assert EvaluationTable.load('abc', str(tmp_path)).lags == {}
+
+
+def test_evaluation_table_computes_missing_lags_once():
+    """Missing lags are computed on demand and then served from the table."""
+    calls = []
+    table = EvaluationTable('abc')
+
+    def compute(lag):
+        calls.append(lag)
+        return EVALUATION
+
+    assert table.get(24, compute) == EVALUATION
+    assert table.get(24, compute) == EVALUATION
+    assert calls == [24]
+
+
+def test_dataset_fingerprint_changes_with_content(tmp_path):
+    """The fingerprint follows the dataset content."""
+    path = tmp_path / 'weather.csv'
+    path.write_text('event_start,belief_horizon_in_sec,event_value,sensor\n')
+    fingerprint = dataset_fingerprint(str(path))
+    path.write_text('event_start,belief_horizon_in_sec,event_value,sensor\n2023-01-01,0,1.0,temperature\n')
+    assert dataset_fingerprint(str(path)) != fingerprint
+
+
+def test_evaluation_table_keeps_the_first_evaluation_put():
+    """Concurrent computations of a lag all serve the evaluation kept first."""
+    table = EvaluationTable('abc')
+
+    assert table.put(24, EVALUATION) == EVALUATION
+    assert table.put(24, {'rmse_values': {}}) == EVALUATION
+    assert 24 in table and 48 not in table
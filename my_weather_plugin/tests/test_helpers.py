@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from my_weather_plugin.helpers import NearestValueIndex, extract_nearset_value_to_date, get_nearst_values_to_now, \
+    get_nearst_values_to_many, get_transformed_data_frames
+
+
+def make_sensor_table():
+    """Small unsorted sensor frame with duplicated exact times."""
+    exact_times = ['2023-01-01 03:00', '2023-01-01 01:00', '2023-01-01 02:00', '2023-01-01 01:00',
+                   '2023-01-01 05:00']
+    return pd.DataFrame({
+        'exact_time': pd.to_datetime(exact_times, utc=True),
+        'event_value': [3.0, 1.0, 2.0, 1.5, 5.0],
+    })
+
+
+def test_nearest_value_index_matches_scan():
+    """Binary search lookups should return the same value as the idxmin scan, ties and bounds included."""
+    table = make_sensor_table()
+    index = NearestValueIndex(table)
+    dates = [datetime(2023, 1, 1, 0), datetime(2023, 1, 1, 1), datetime(2023, 1, 1, 1, 30),
+             datetime(2023, 1, 1, 2, 20), datetime(2023, 1, 1, 4), datetime(2023, 1, 1, 9)]
+    for date in dates:
+        assert index.lookup(date) == extract_nearset_value_to_date(table, date)
+    assert list(index.lookup_many(dates)) == [extract_nearset_value_to_date(table, date) for date in dates]
+
+
+def test_nearest_values_index_on_real_data():
+    """Index and scan agree on the real sensor frames, for single and batch lookups."""
+    frames = get_transformed_data_frames()
+    indexes = [NearestValueIndex(frame) for frame in frames]
+    nows = [datetime.now() - timedelta(hours=hours) for hours in range(0, 24 * 30, 7)]
+
+    batch = get_nearst_values_to_many(*indexes, nows)
+    for position, now in enumerate(nows):
+        expected = get_nearst_values_to_now(*frames, now)
+        assert get_nearst_values_to_now(*indexes, now) == expected
+        assert {sensor: values[position] for sensor, values in batch.items()} == expected
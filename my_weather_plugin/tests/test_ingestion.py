@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+import numpy as np
+
+from my_weather_plugin.helpers import read_weather_data, get_transformed_data_frames
+from my_weather_plugin.weather_forecast import get_speccing_csv_series_specs, get_speccing_weather_data_series_specs
+
+
+def test_single_pass_series_match_csv_specs():
+    """Series built from the frame read once should equal the ones CSVFileSeriesSpecs reads per sensor."""
+    weather_data = read_weather_data()
+    for sensor in ['temperature', 'irradiance', 'wind speed']:
+        expected = get_speccing_csv_series_specs(sensor).load_series(expected_frequency=timedelta(hours=1))
+        series = get_speccing_weather_data_series_specs(weather_data, sensor).load_series(
+            expected_frequency=timedelta(hours=1))
+        assert (series.index == expected.index).all()
+        assert np.allclose(series.to_numpy(), expected.to_numpy(), equal_nan=True)
+
+
+def test_single_pass_frames_are_split_per_sensor():
+    """The shared frame keeps a categorical sensor column and is split into one frame per sensor."""
+    weather_data = read_weather_data()
+    temperature, irradiance, wind_speed = get_transformed_data_frames(weather_data=weather_data)
+    assert weather_data['sensor'].dtype.name == 'category'
+    assert set(temperature['sensor']) == {'temperature'}
+    assert set(irradiance['sensor']) == {'irradiance'}
+    assert set(wind_speed['sensor']) == {'wind speed'}
+    assert 'exact_time' in temperature
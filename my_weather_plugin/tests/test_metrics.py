@@ -0,0 +1,61 @@
+import time
+from datetime import datetime, timedelta
+
+from my_weather_plugin.metrics import MetricsRegistry, SamplingProfiler
+
+
+def test_histograms_render_cumulative_prometheus_buckets():
+    registry = MetricsRegistry()
+    for value in (0.0002, 0.003, 0.003, 2):
+        registry.observe('weather_stage_duration_seconds', value, stage='parse_date')
+    registry.increment('weather_requests_total', endpoint='get_forecasts', status=200)
+
+    lines = registry.render().splitlines()
+
+    assert '# TYPE weather_stage_duration_seconds histogram' in lines
+    assert 'weather_stage_duration_seconds_bucket{stage="parse_date",le="0.00025"} 1' in lines
+    assert 'weather_stage_duration_seconds_bucket{stage="parse_date",le="0.005"} 3' in lines
+    assert 'weather_stage_duration_seconds_bucket{stage="parse_date",le="+Inf"} 4' in lines
+    assert 'weather_stage_duration_seconds_count{stage="parse_date"} 4' in lines
+    assert 'weather_requests_total{endpoint="get_forecasts",status="200"} 1' in lines
+
+
+def test_sampling_profiler_collects_the_stacks_of_its_thread():
+    def busy_wait():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+
+    with SamplingProfiler(interval=0.001) as profiler:
+        busy_wait()
+
+    assert 'busy_wait' in profiler.collapsed()
+
+
+def test_metrics_endpoint_exposes_request_stages(client):
+    """After a forecast, /metrics has the stages it went through and the request count, as Prometheus text."""
+    now = datetime.now()
+    client.get(f"/forecasts?now={now.strftime('%Y-%m-%d %H:%M:%S')}"
+               f"&then={(now + timedelta(hours=2)).strftime('%Y-%m-%d %H:%M:%S')}")
+
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    for stage in ('parse_date', 'nearest_lookup', 'forecast', 'json_serialization'):
+        assert f'stage="{stage}"' in body
+    assert 'weather_requests_total{endpoint="get_forecasts",status="200",site="default"}' in body
+
+
+def test_profiled_request_returns_a_profile_id(client, monkeypatch):
+    now = datetime.now()
+    url = f"/tomorrow?now={now.strftime('%Y-%m-%d %H:%M:%S')}"
+    assert 'X-Profile-Id' not in client.get(url, headers={'X-Profile': '1'}).headers
+    monkeypatch.setattr('my_weather_plugin.helpers.ADMIN_TOKEN', 'secret')
+    response = client.get(url, headers={'X-Profile': '1', 'X-Admin-Token': 'secret'})
+
+    assert response.status_code == 200
+    profile = client.get(f"/metrics/profiles/{response.headers['X-Profile-Id']}")
+    assert profile.status_code == 200
+    assert client.get('/metrics/profiles/unknown').status_code == 404
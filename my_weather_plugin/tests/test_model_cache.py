@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from my_weather_plugin.model_cache import FittedModelCache
+
+
+def test_model_cache_counts_hits_and_misses():
+    """The factory should only run on a miss."""
+    cache = FittedModelCache(maxsize=4)
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return object()
+
+    first = cache.get_or_create(('temperature', 24), factory)
+    second = cache.get_or_create(('temperature', 24), factory)
+
+    assert first is second
+    assert len(calls) == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_model_cache_evicts_least_recently_used():
+    """Past maxsize the least recently used key is dropped."""
+    cache = FittedModelCache(maxsize=2)
+    cache.get_or_create(('temperature', 1), object)
+    cache.get_or_create(('temperature', 2), object)
+    cache.get_or_create(('temperature', 1), object)
+    cache.get_or_create(('temperature', 3), object)
+
+    assert ('temperature', 1) in cache
+    assert ('temperature', 2) not in cache
+    assert cache.evictions == 1
+
+
+def test_model_cache_invalidate():
+    """Invalidating without keys clears every entry."""
+    cache = FittedModelCache(maxsize=2)
+    cache.get_or_create(('temperature', 1), object)
+    cache.get_or_create(('irradiance', 1), object)
+    cache.invalidate([('temperature', 1)])
+    assert len(cache) == 1
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_model_cache_single_flight_under_concurrency():
+    """Many threads missing on the same keys at once should trigger one factory call per key."""
+    cache = FittedModelCache(maxsize=8)
+    calls = {}
+    calls_lock = threading.Lock()
+    start = threading.Barrier(32)
+
+    def request(lag):
+        def factory():
+            with calls_lock:
+                calls[lag] = calls.get(lag, 0) + 1
+            time.sleep(0.05)
+            return ('model', lag)
+
+        start.wait()
+        return lag, cache.get_or_create(('temperature', lag), factory)
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        results = list(executor.map(request, [i % 4 for i in range(32)]))
+
+    assert calls == {0: 1, 1: 1, 2: 1, 3: 1}
+    assert all(entry == ('model', lag) for lag, entry in results)
+
+
+def test_model_cache_drops_entries_built_for_an_older_generation():
+    """A fit started before an invalidate() must not be stored afterwards."""
+    cache = FittedModelCache(maxsize=2)
+    generation = cache.generation
+    cache.invalidate()
+    cache.get_or_create(('temperature', 1), object, generation=generation)
+    assert ('temperature', 1) not in cache
@@ -0,0 +1,59 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from main import create_app
+from my_weather_plugin.helpers import ServiceOverloaded
+from my_weather_plugin.offload import ComputeOffloader
+
+
+@pytest.fixture()
+def offloading_app():
+    app = create_app(warm_up_models=False, refresh_interval=0, offload_workers=2)
+    app.config.update({"TESTING": True})
+    yield app
+    app.extensions['offloader'].shutdown()
+
+
+def test_offloaded_forecasts_match_inline_forecasts(offloading_app, client):
+    """Forecasts computed in the offload pool are the ones computed in the server process."""
+    now = datetime.now()
+    query = f"/forecasts?now={now.strftime('%Y-%m-%d %H:%M:%S')}" \
+            f"&then={(now + timedelta(hours=6)).strftime('%Y-%m-%d %H:%M:%S')}"
+
+    offloaded = offloading_app.test_client().get(query)
+    inline = client.get(query)
+
+    assert offloaded.status_code == 200
+    for variable, value in inline.json.items():
+        assert abs(offloaded.json[variable] - value) < 1e-6
+    assert offloading_app.test_client().get('/').json['offload']['submitted'] == 1
+
+
+def test_identical_computations_are_coalesced():
+    offloader = ComputeOffloader(max_workers=1, max_pending=4)
+    try:
+        first = offloader.submit('key', time.sleep, 0.5)
+        second = offloader.submit('key', time.sleep, 0.5)
+        assert first is second
+        first.result()
+        assert offloader.stats() == {'pending': 0, 'max_pending': 4, 'submitted': 1, 'coalesced': 1, 'rejected': 0}
+    finally:
+        offloader.shutdown()
+
+
+def test_full_offload_queue_returns_503(offloading_app):
+    """Past max_pending distinct computations, requests are refused instead of queued."""
+    offloader = offloading_app.extensions['offloader']
+    offloader.max_pending = 0
+    now = datetime.now() - timedelta(days=3)
+
+    response = offloading_app.test_client().get(
+        f"/forecasts?now={now.strftime('%Y-%m-%d %H:%M:%S')}"
+        f"&then={(now + timedelta(hours=5)).strftime('%Y-%m-%d %H:%M:%S')}")
+
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    with pytest.raises(ServiceOverloaded):
+        offloader.submit('other', time.sleep, 0)
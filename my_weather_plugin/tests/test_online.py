@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+import numpy as np
+from timetomodel import create_fitted_model
+from timetomodel.featuring import construct_features
+
+from my_weather_plugin.consts import target_variables
+from my_weather_plugin.forecasting import LazyForecastModel
+from my_weather_plugin.online import RecursiveLeastSquares, OnlineOLSModel
+from my_weather_plugin.tests.test_data_store import make_store, append_rows
+from my_weather_plugin.weather_forecast import WEATHER_FORECAST_MODEL
+
+
+def test_recursive_least_squares_matches_batch_solution():
+    """Row by row updates (and removals) give the least squares solution of the remaining rows."""
+    random = np.random.default_rng(0)
+    x = random.normal(size=(200, 3))
+    y = x @ np.array([0.5, -2.0, 1.0]) + random.normal(scale=0.1, size=200)
+
+    estimator = RecursiveLeastSquares(3)
+    estimator.update(x[:20], y[:20])
+    for row, value in zip(x[20:], y[20:]):
+        estimator.update(row, value)
+    assert np.allclose(estimator.params, np.linalg.lstsq(x, y, rcond=None)[0])
+
+    estimator.downdate(x[:50], y[:50])
+    assert np.allclose(estimator.params, np.linalg.lstsq(x[50:], y[50:], rcond=None)[0])
+
+
+def test_online_models_match_timetomodel_ols():
+    """Coefficients of the online estimator equal those of create_fitted_model, also when fitted in two steps."""
+    forecasting_model = WEATHER_FORECAST_MODEL()
+    for lag in (1, 24):
+        for target_variable in target_variables:
+            specs = forecasting_model.get_model_specs(lag=lag, target_variable=target_variable)
+            regression_frame = construct_features(time_range="train", specs=specs)
+            expected = np.asarray(create_fitted_model(specs, "parity").params)
+
+            half = len(regression_frame) // 2
+            online_model = OnlineOLSModel.fit(regression_frame.iloc[:half])
+            online_model.update(regression_frame.iloc[half:])
+
+            assert np.allclose(online_model.params, expected, rtol=1e-6, atol=1e-8)
+            assert online_model.trained_until == regression_frame.index[-1]
+
+
+def test_online_estimator_option_forecasts_like_ols():
+    """The model's online estimator option gives the same per-lag parameters as the OLS refits."""
+    ols_model = WEATHER_FORECAST_MODEL()
+    online_model = WEATHER_FORECAST_MODEL(estimator='online')
+    assert np.allclose(online_model.get_lag_parameters(12), ols_model.get_lag_parameters(12), rtol=1e-6, atol=1e-8)
+
+
+def test_refresh_updates_online_models_like_a_refit(tmp_path):
+    """Appended rows are added to the cached online models, which then equal models fitted on all the data."""
+    store = make_store(tmp_path)
+    store.forecasting_model = LazyForecastModel(lambda fitted_models: WEATHER_FORECAST_MODEL(
+        weather_data=store.weather_data, fitted_models=fitted_models, estimator='online'))
+    store.forecasting_model.train_models(1)
+    cached_model = store.forecasting_model.get_cached_model(1, 'temperature')
+
+    last_event = store.weather_data['event_start'].max()
+    append_rows(store, [
+        ((last_event + timedelta(hours=hour)).strftime('%Y-%m-%d %H:%M:%S+00:00'), 3600, value, sensor)
+        for hour in range(1, 200)
+        for value, sensor in [(10 + hour % 7, 'temperature'), (hour % 11 * 50, 'irradiance'),
+                              (hour % 5, 'wind speed')]
+    ])
+    result = store.refresh()
+
+    updated_model = store.forecasting_model.get_cached_model(1, 'temperature')
+    assert result['invalidated_models'] == 0
+    assert updated_model.trained_until > cached_model.trained_until
+    refit = WEATHER_FORECAST_MODEL(weather_data=store.weather_data, estimator='online')
+    assert np.allclose(store.forecasting_model.get_lag_parameters(1), refit.get_lag_parameters(1),
+                       rtol=1e-6, atol=1e-8)
@@ -0,0 +1,77 @@
+import numpy as np
+
+from my_weather_plugin.response_cache import LocalBackend, RedisBackend, ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Stand-in for a redis.Redis client: bytes values, expiring after px milliseconds of the clock."""
+    def __init__(self, clock):
+        self._clock = clock
+        self._entries = {}
+
+    def get(self, key):
+        value, expires_at = self._entries.get(key, (None, None))
+        if value is None or expires_at <= self._clock():
+            return None
+        return value
+
+    def set(self, key, value, px=None):
+        self._entries[key] = (value.encode(), self._clock() + px / 1000 if px else float('inf'))
+
+
+def test_local_backend_expires_entries():
+    """Entries are dropped once their time to live has passed."""
+    clock = FakeClock()
+    backend = LocalBackend(maxsize=10, clock=clock)
+    backend.set('key', {'temperature': 1.0}, ttl=60)
+
+    clock.now = 59
+    assert backend.get('key') == {'temperature': 1.0}
+    clock.now = 60
+    assert backend.get('key') is None
+
+
+def test_local_backend_evicts_least_recently_used():
+    """Past maxsize the least recently used entry is evicted."""
+    backend = LocalBackend(maxsize=2)
+    backend.set('a', 1, ttl=60)
+    backend.set('b', 2, ttl=60)
+    backend.get('a')
+    backend.set('c', 3, ttl=60)
+
+    assert backend.get('b') is None
+    assert backend.get('a') == 1
+    assert backend.evictions == 1
+
+
+def test_response_cache_shared_backend_counts_hits():
+    """Two caches on the same backend (like two workers on a shared one) share computed responses."""
+    backend = LocalBackend()
+    first_worker, second_worker = ResponseCache(backend), ResponseCache(backend)
+    key = ResponseCache.make_key('forecast', 'version', 24, 1, 2, 3)
+
+    assert first_worker.get_or_compute(key, lambda: {'temperature': 1.0}) == {'temperature': 1.0}
+    assert second_worker.get_or_compute(key, lambda: {'temperature': 2.0}) == {'temperature': 1.0}
+    assert (first_worker.misses, second_worker.hits) == (1, 1)
+
+
+def test_redis_backend_stores_json_with_a_time_to_live():
+    """Responses go through Redis as JSON (NumPy floats included) and expire with the cache's ttl."""
+    clock = FakeClock()
+    backend = RedisBackend(client=FakeRedis(clock))
+    cache = ResponseCache(backend, ttl=60)
+    key = ResponseCache.make_key('forecast', 'version', 24)
+
+    cache.get_or_compute(key, lambda: {'temperature': np.float32(1.5), 'irradiance': [1, 2]})
+    assert ResponseCache(backend).get_or_compute(key, dict) == {'temperature': 1.5, 'irradiance': [1, 2]}
+    clock.now = 60
+    assert cache.get_or_compute(key, lambda: {'temperature': 2.0}) == {'temperature': 2.0}
+    assert (cache.hits, cache.misses) == (0, 2)
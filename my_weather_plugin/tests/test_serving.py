@@ -0,0 +1,39 @@
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+from urllib.request import urlopen
+
+import pytest
+
+from my_weather_plugin.consts import path_url
+from my_weather_plugin.load_test import ROOT, wait_until_ready
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='pre-fork serving needs os.fork')
+def test_prefork_workers_share_the_listening_socket(tmp_path):
+    """A multi-worker server answers on one port, and stops with all its workers on SIGTERM."""
+    # The artifacts the server builds go to tmp_path, where other tests' stores can't pick them up
+    data_path = tmp_path / 'weather.csv'
+    shutil.copy(os.path.join(ROOT, path_url), data_path)
+    environment = dict(os.environ, ARTIFACTS_DIR=str(tmp_path / 'artifacts'), SITES_DIR=str(tmp_path / 'sites'))
+    port = free_port()
+    server = subprocess.Popen([sys.executable, 'main.py', '--workers', '2', '--port', str(port),
+                               '--data', str(data_path)], cwd=ROOT, env=environment)
+    try:
+        wait_until_ready(f'http://127.0.0.1:{port}')
+        for _ in range(10):
+            with urlopen(f'http://127.0.0.1:{port}/') as response:
+                assert json.loads(response.read())['status'] == 200
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
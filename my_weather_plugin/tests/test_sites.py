@@ -0,0 +1,78 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from main import create_app
+from my_weather_plugin.tests.synthetic import generate_weather_csv
+
+NOW = (datetime.utcnow() - timedelta(days=2)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+@pytest.fixture()
+def sites_dir(tmp_path):
+    directory = tmp_path / 'sites'
+    directory.mkdir()
+    for seed, site in enumerate(('north', 'south')):
+        generate_weather_csv(directory / f'{site}.csv', 3_000, seed=seed)
+    return str(directory)
+
+
+@pytest.fixture()
+def artifacts_root(tmp_path):
+    return str(tmp_path / 'artifacts')
+
+
+def test_sites_are_loaded_on_first_request(sites_dir, artifacts_root):
+    app = create_app(sites_dir=sites_dir, artifacts_root=artifacts_root)
+    sites = app.extensions['sites']
+    assert sites.stats()['loaded'] == ['default']
+
+    response = app.test_client().get(f'/tomorrow?site=north&now={NOW}')
+
+    assert response.status_code == 200
+    assert sites.stats()['loaded'] == ['default', 'north']
+    assert sites.stats()['configured'] == 3
+
+
+def test_least_recently_used_site_is_unloaded_past_the_budget(sites_dir, artifacts_root):
+    """With no budget left, loading a site unloads the previous one, but never the pinned default site."""
+    app = create_app(sites_dir=sites_dir, sites_memory_budget_mb=0, artifacts_root=artifacts_root)
+    client, sites = app.test_client(), app.extensions['sites']
+
+    client.get(f'/tomorrow?site=north&now={NOW}')
+    client.get(f'/tomorrow?site=south&now={NOW}')
+    assert sites.stats()['loaded'] == ['default', 'south']
+
+    assert client.get(f'/tomorrow?site=north&now={NOW}').status_code == 200
+    assert (sites.loads, sites.evictions) == (3, 2)
+
+
+def test_unknown_site_is_not_found(sites_dir, artifacts_root):
+    client = create_app(sites_dir=sites_dir, artifacts_root=artifacts_root).test_client()
+
+    assert client.get(f'/tomorrow?site=nowhere&now={NOW}').status_code == 404
+    assert client.get('/?site=nowhere').status_code == 404
+
+
+def test_sites_have_their_own_cache_counters_and_metrics(sites_dir, artifacts_root):
+    app = create_app(sites_dir=sites_dir, artifacts_root=artifacts_root)
+    client = app.test_client()
+
+    first = client.get(f'/tomorrow?site=south&now={NOW}')
+    second = client.get(f'/tomorrow?site=south&now={NOW}')
+
+    assert first.json == second.json
+    assert client.get('/?site=south').json['response_cache']['hits'] == 1
+    assert client.get('/').json['response_cache']['hits'] == 0
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'weather_response_cache_hits_total{site="south"} 1' in body
+    assert 'weather_requests_total{endpoint="get_tomorrow",status="200",site="south"}' in body
+
+
+def test_site_artifacts_are_kept_under_the_configured_root(sites_dir, artifacts_root):
+    configs = create_app(sites_dir=sites_dir, artifacts_root=artifacts_root).extensions['sites'].configs
+
+    assert configs['north'].artifacts_dir == os.path.join(artifacts_root, 'sites', 'north', 'models')
+    assert configs['south'].columnar_dir == os.path.join(artifacts_root, 'sites', 'south', 'columnar')
+    assert configs['default'].columnar_dir == os.path.join(artifacts_root, 'columnar')
@@ -0,0 +1,47 @@
+import json
+import os
+import subprocess
+import sys
+
+from my_weather_plugin.artifacts import build_model_artifacts
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+HEAVY_MODULES = ['pandas', 'statsmodels', 'timetomodel', 'dateutil.parser', 'flask_bootstrap', 'flask_compress',
+                 'my_weather_plugin.weather_forecast']
+# Generous budget for importing main in a fresh interpreter, a regression (e.g. an eager pandas import) blows it
+IMPORT_TIME_BUDGET_SECONDS = 1.5
+
+
+def run_python(code: str) -> dict:
+    """Run code in a fresh interpreter from the repository root and return the JSON it prints."""
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def test_importing_main_is_light():
+    """Importing main must not pull in the forecasting stack, and stays within the import time budget."""
+    result = run_python(
+        'import json, sys, time\n'
+        'start = time.perf_counter()\n'
+        'import main\n'
+        'elapsed = time.perf_counter() - start\n'
+        f'print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n'
+    )
+    print(f"importing main took {result['elapsed']:.3f}s")
+    assert result['loaded'] == []
+    assert result['elapsed'] < IMPORT_TIME_BUDGET_SECONDS
+
+
+def test_serving_from_artifacts_skips_the_forecasting_stack(tmp_path):
+    """With model artifacts the app starts and answers status and forecasts without statsmodels/timetomodel/pandas."""
+    build_model_artifacts(directory=str(tmp_path), lags=[24])
+    result = run_python(
+        'import json, sys\n'
+        'from main import create_app\n'
+        f'client = create_app(artifacts_dir={str(tmp_path)!r}).test_client()\n'
+        'codes = [client.get("/").status_code,\n'
+        '         client.get("/forecasts?now=2023-01-01 00:00:00&then=2023-01-02 00:00:00").status_code]\n'
+        f'print(json.dumps({{"codes": codes, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n'
+    )
+    assert result['codes'] == [200, 200]
+    assert set(result['loaded']) <= {'dateutil.parser', 'flask_compress'}
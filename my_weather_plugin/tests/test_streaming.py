@@ -0,0 +1,98 @@
+import gzip
+import io
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from my_weather_plugin.consts import FORECAST_RANGE_MAX_HOURS
+from my_weather_plugin.streaming import gzip_chunks
+
+
+def range_query(hours: int, lag: int = 24) -> str:
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=10)
+    end = start + timedelta(hours=hours - 1)
+    return f"/forecasts/range?start={start.strftime('%Y-%m-%d %H:%M:%S')}" \
+           f"&end={end.strftime('%Y-%m-%d %H:%M:%S')}&lag={lag}"
+
+
+def test_gzip_chunks_can_be_decoded_as_they_arrive():
+    chunks = [f'{{"row": {row}}}\n'.encode() for row in range(100)]
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    compressed = gzip_chunks(chunks)
+
+    # Every chunk is flushed, so what was received so far decodes to the rows sent so far
+    assert decompressor.decompress(next(compressed)) == chunks[0]
+    assert decompressor.decompress(b''.join(compressed)) == b''.join(chunks[1:])
+
+
+def test_forecast_range_streams_ndjson_rows_matching_single_forecasts(client):
+    response = client.get(range_query(2500, lag=6))
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) == 2500
+    for row in (rows[0], rows[-1]):
+        now = datetime.fromisoformat(row['now'].rstrip('Z'))
+        single = client.get(f"/forecasts?now={now.strftime('%Y-%m-%d %H:%M:%S')}"
+                            f"&then={(now + timedelta(hours=6)).strftime('%Y-%m-%d %H:%M:%S')}").json
+        for variable, value in single.items():
+            assert abs(row[variable] - value) < 1e-6
+
+
+def test_forecast_range_is_gzipped_chunk_by_chunk(client):
+    plain = client.get(range_query(1500))
+    response = client.get(range_query(1500), headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+
+
+def test_forecast_range_as_numpy_chunks(client):
+    response = client.get(range_query(2500), headers={'Accept': 'application/x-npy'})
+
+    assert response.mimetype == 'application/x-npy'
+    stream = io.BytesIO(response.get_data())
+    chunks = []
+    while stream.tell() < len(stream.getbuffer()):
+        chunks.append(np.load(stream))
+    rows = np.concatenate(chunks)
+    assert len(chunks) == 3
+    assert len(rows) == 2500
+    assert (rows['then'] - rows['now'] == np.timedelta64(24, 'h')).all()
+
+
+def test_forecast_curve_negotiates_ndjson(client):
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    curve = client.get(f'/forecasts/curve?now={now}').json
+    response = client.get(f'/forecasts/curve?now={now}', headers={'Accept': 'application/x-ndjson'})
+
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['temperature'] for row in rows] == curve['temperature']
+
+
+def test_forecast_range_invalid_requests(client):
+    assert client.get('/forecasts/range?start=2023-01-01 00:00:00').status_code == 400
+    assert client.get('/forecasts/range?start=2023-01-02 00:00:00&end=2023-01-01 00:00:00').status_code == 400
+    assert client.get('/forecasts/range?start=2023-01-01 00:00:00&end=2023-01-02 00:00:00&lag=49').status_code == 400
+    assert client.get(range_query(FORECAST_RANGE_MAX_HOURS + 1)).status_code == 400
+
+
+def test_error_while_streaming_is_logged_and_counted(client, monkeypatch, caplog):
+    """An error raised once the view returned cuts the stream off, after being logged and counted."""
+    def fail(features, lags):
+        raise RuntimeError('forecast failed')
+
+    monkeypatch.setattr(client.application.extensions['data_store'].forecasting_model, 'forecast_batch', fail)
+    # The package's records do not propagate to the root logger caplog listens to
+    monkeypatch.setattr(logging.getLogger('my_weather_plugin'), 'handlers', [caplog.handler])
+    with pytest.raises(RuntimeError):
+        client.get(range_query(10)).get_data()
+
+    assert 'Error while streaming the forecasts_range response' in caplog.text
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'weather_stream_errors_total{endpoint="forecasts_range",site="default"} 1' in body
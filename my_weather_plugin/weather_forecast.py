@@ -1,5 +1,8 @@
+import threading
 from copy import copy
 from datetime import timedelta
+from types import MappingProxyType
+from typing import NamedTuple
 
 import numpy as np
 import pandas as pd
@@ -8,27 +11,40 @@ from timetomodel import speccing, create_fitted_model, ModelState, make_forecast
 from timetomodel.featuring import construct_features
 from timetomodel.transforming import Transformation
 import statsmodels.api as sm
+from sklearn.base import RegressorMixin
 
-from my_weather_plugin.consts import target_variables, path_url
+from my_weather_plugin.beliefs import latest_beliefs, latest_belief_positions
+from my_weather_plugin.consts import target_variables, path_url, WARM_UP_LAGS, MODEL_CACHE_SIZE, \
+    RATIO_TRAINING_TESTING_DATA, MODEL_ESTIMATOR
+from my_weather_plugin.forecasting import ParameterForecaster
+from my_weather_plugin.helpers import read_weather_data
+from my_weather_plugin.metrics import timed
+from my_weather_plugin.model_cache import FittedModelCache
+from my_weather_plugin.online import OnlineOLSModel
+
+
+class OnlineRegressor(OnlineOLSModel, RegressorMixin):
+    """
+    OnlineOLSModel as a scikit-learn regressor, one of the fitted model types timetomodel's ModelState accepts.
+    The mixin is added here rather than in online.py, which is imported at startup without scikit-learn.
+    """
 
 
 class MyDFPostProcessing(Transformation):
     """
     Custom transformation class to preprocess DataFrame specific to a given sensor.
-    Applies filtering, sorting, and de-duplication.
+    Keeps the most recent belief per event of that sensor (see latest_belief_positions), sorted by event start.
     """
     def __init__(self, sensor):
         self.sensor = sensor
 
     def transform_dataframe(self, df: pd.DataFrame):
         """Keep the most recent observation, drop duplicates, filter by sensor"""
-
         df = df[df['sensor'] == self.sensor]
-        return (
-            df.sort_values(by=["belief_horizon_in_sec"], ascending=True)
-            .drop_duplicates(subset=["event_start"], keep="first")
-            .sort_values(by=["event_start"])
-        )
+        positions = latest_belief_positions(np.zeros(len(df), dtype=np.int8),
+                                            pd.DatetimeIndex(df['event_start']).asi8,
+                                            df['belief_horizon_in_sec'].to_numpy())
+        return df.iloc[positions]
 
 
 def get_speccing_object_series_specs(df, sensor):
@@ -46,6 +62,29 @@ def get_speccing_object_series_specs(df, sensor):
     )
 
 
+def get_speccing_weather_data_series_specs(weather_data: pd.DataFrame, sensor, beliefs: pd.Series = None):
+    """
+    Configure specifications for a sensor's hourly series from the already parsed belief frame,
+    keeping the most recent belief per event like CSVFileSeriesSpecs does through MyDFPostProcessing.
+    beliefs is the sensor's series from latest_beliefs, when it was already computed for every sensor at once.
+    """
+    if beliefs is None:
+        beliefs = latest_beliefs(weather_data)[sensor]
+    return speccing.ObjectSeriesSpecs(data=beliefs.rename(None), name=sensor)
+
+
+def load_hourly_series(weather_data: pd.DataFrame, sensors=tuple(target_variables), as_of=None,
+                       columnar=None) -> dict:
+    """
+    Hourly series of the given sensors, from one deduplication pass over the belief frame for all of them.
+    With as_of only the beliefs formed at or before that time are used (e.g. for backtesting).
+    With a columnar dataset the beliefs are its mapped columns plus the rows of weather_data (see latest_beliefs).
+    """
+    beliefs = latest_beliefs(weather_data, as_of=as_of, columnar=columnar)
+    return {sensor: get_speccing_weather_data_series_specs(weather_data, sensor, beliefs[sensor]).load_series(
+        expected_frequency=timedelta(hours=1)) for sensor in sensors}
+
+
 def get_speccing_csv_series_specs(sensor):
     """
     Configure specifications for loading and processing data from a CSV file using the CSVFileSeriesSpecs class
@@ -62,15 +101,42 @@ def get_speccing_csv_series_specs(sensor):
     )
 
 
-class WEATHER_FORECAST_MODEL():
+def earliest_change(previous: pd.Series, current: pd.Series):
+    """
+    Return the first timestamp at which two versions of a series differ (missing on one side counts), or None.
+    """
+    index = previous.index.union(current.index)
+    previous, current = previous.reindex(index), current.reindex(index)
+    changed = ~((previous == current) | (previous.isna() & current.isna()))
+    return index[changed.to_numpy().argmax()] if changed.any() else None
+
+
+class SeriesSnapshot(NamedTuple):
+    """
+    Immutable set of hourly series (and their specs) the models are trained on.
+    It is swapped as a whole, so a request never mixes series from two data versions.
+    """
+    temperature_series: pd.Series
+    irradiance_series: pd.Series
+    wind_speed_series: pd.Series
+    temperature_object_series: speccing.ObjectSeriesSpecs
+    irradiance_object_series: speccing.ObjectSeriesSpecs
+    wind_speed_object_series: speccing.ObjectSeriesSpecs
+    version: int
+
+
+class WEATHER_FORECAST_MODEL(ParameterForecaster):
     """
     A model for forecasting weather variables such as temperature, irradiance, and wind speed.
     Initializes data series from specified sources and prepares them for modeling.
     """
-    def __init__(self):
+    def __init__(self, weather_data: pd.DataFrame = None, model_cache_size: int = MODEL_CACHE_SIZE,
+                 fitted_models: FittedModelCache = None, estimator: str = MODEL_ESTIMATOR, columnar=None):
 
         """
-        I commented the code below because I worked ObjectSeriesSpecs first and changed  to CSVFileSeriesSpecs
+        I commented the code below because I worked ObjectSeriesSpecs first and changed  to CSVFileSeriesSpecs.
+        The series are now built from the belief frame read once by read_weather_data (read here when not given),
+        or from a memory-mapped columnar dataset (ColumnarBeliefs) and the rows appended to the CSV since.
         """
         # def __init__(self, temperature_data=None, irradiance_data=None, wind_speed_data=None):
         # also we can work wih CSVFileSeriesSpecs inplace of ObjectSeriesSpecs
@@ -82,35 +148,152 @@ class WEATHER_FORECAST_MODEL():
         # wind_speed_series = wind_speed_data_specs.load_series(expected_frequency=timedelta(hours=1))
 
         self.fitted_model = None
-        self.temperature_series = get_speccing_csv_series_specs('temperature').load_series(
-            expected_frequency=timedelta(hours=1))
-        self.temperature_object_series = speccing.ObjectSeriesSpecs(self.temperature_series, name="temperature")
-        self.irradiance_series = get_speccing_csv_series_specs('irradiance').load_series(
-            expected_frequency=timedelta(hours=1))
-        self.irradiance_object_series = speccing.ObjectSeriesSpecs(self.irradiance_series, name="irradiance")
-        self.wind_speed_series = get_speccing_csv_series_specs('wind speed').load_series(
-            expected_frequency=timedelta(hours=1))
-        self.wind_speed_object_series = speccing.ObjectSeriesSpecs(self.wind_speed_series, name="wind speed")
-        self.fitted_models = {}
-
-    def get_model_specs(self, lag=24, target_variable="temperature"):
+        self.fitted_models = fitted_models if fitted_models is not None else FittedModelCache(maxsize=model_cache_size)
+        self.estimator = estimator
+        self.series = None
+        self._series_lock = threading.Lock()
+        if weather_data is None and columnar is None:
+            weather_data = read_weather_data()
+        hourly_series = load_hourly_series(weather_data, columnar=columnar)
+        self.update_series(
+            temperature_series=hourly_series['temperature'],
+            irradiance_series=hourly_series['irradiance'],
+            wind_speed_series=hourly_series['wind speed'],
+        )
+
+    def update_series(self, temperature_series, irradiance_series, wind_speed_series):
+        """
+        Replace the hourly series the models are trained on and bump the data version.
+        Cached models whose training window changed are invalidated, the others are kept (with up to date specs).
+        """
+        with self._series_lock:
+            previous = self.series
+            self.series = SeriesSnapshot(
+                temperature_series=temperature_series,
+                irradiance_series=irradiance_series,
+                wind_speed_series=wind_speed_series,
+                temperature_object_series=speccing.ObjectSeriesSpecs(temperature_series, name="temperature"),
+                irradiance_object_series=speccing.ObjectSeriesSpecs(irradiance_series, name="irradiance"),
+                wind_speed_object_series=speccing.ObjectSeriesSpecs(wind_speed_series, name="wind speed"),
+                version=self.data_version + 1,
+            )
+            if previous is None:
+                self.fitted_models.invalidate()
+            else:
+                self._invalidate_changed_models(previous, self.series)
+
+    def refresh_series(self, weather_data: pd.DataFrame, sensors=tuple(target_variables), columnar=None):
+        """
+        Rebuild the hourly series of the given sensors from the (grown) belief frame, keeping the others.
+        """
+        series = self.series
+        rebuilt = load_hourly_series(weather_data, sensors, columnar=columnar)
+        self.update_series(
+            temperature_series=rebuilt.get('temperature', series.temperature_series),
+            irradiance_series=rebuilt.get('irradiance', series.irradiance_series),
+            wind_speed_series=rebuilt.get('wind speed', series.wind_speed_series),
+        )
+
+    @staticmethod
+    def training_window_end(lag, series: SeriesSnapshot):
+        """
+        Last timestamp of the training data of a lag's models, following the split done by get_model_specs
+        (rounded to the hour, as timetomodel does for the "train" range).
+        """
+        start_of_training = series.temperature_series.index[0] + timedelta(hours=lag)
+        end_of_testing = series.temperature_series.index[-1] - timedelta(hours=lag)
+        return (start_of_training + (end_of_testing - start_of_training) * RATIO_TRAINING_TESTING_DATA).round("H")
+
+    def _invalidate_changed_models(self, previous: SeriesSnapshot, current: SeriesSnapshot):
+        """
+        Drop the cached models whose training window changed: it saw a changed value, or the modelled time range
+        moved (which moves every window). Online models whose own training rows are unchanged are kept instead,
+        and the rows newly in their training window are added to them.
+        """
+        previous_index, current_index = previous.temperature_series.index, current.temperature_series.index
+        if len(previous_index) == 0 or len(current_index) == 0 or previous_index[0] != current_index[0] \
+                or current_index[-1] < previous_index[-1]:
+            self.fitted_models.invalidate()
+            return
+        range_moved = previous_index[-1] != current_index[-1]
+
+        changes = [earliest_change(previous_series, current_series) for previous_series, current_series in [
+            (previous.temperature_series, current.temperature_series),
+            (previous.irradiance_series, current.irradiance_series),
+            (previous.wind_speed_series, current.wind_speed_series),
+        ]]
+        changes = [change for change in changes if change is not None]
+        if not changes:
+            return
+        changed_since = min(changes)
+
+        stale_keys = []
+        for target_variable, lag in self.fitted_models.keys():
+            window_changed = range_moved or changed_since <= self.training_window_end(lag, current)
+            if not window_changed:
+                continue
+            fitted_model = self.get_cached_model(lag, target_variable)
+            if not isinstance(fitted_model, OnlineOLSModel) or fitted_model.trained_until is None \
+                    or changed_since <= fitted_model.trained_until:
+                stale_keys.append((target_variable, lag))
+        self.fitted_models.invalidate(stale_keys)
+
+        for target_variable, lag in self.fitted_models.keys():
+            model_specs = self.get_model_specs(lag=lag, target_variable=target_variable, series=current)
+            fitted_model = self.get_cached_model(lag, target_variable)
+            if isinstance(fitted_model, OnlineOLSModel):
+                first_new_row = fitted_model.trained_until + timedelta(hours=1)
+                end_of_new_rows = self.training_window_end(lag, current) + timedelta(hours=1)
+                if first_new_row < end_of_new_rows:
+                    # Updated on a copy, requests holding the cached model keep a consistent one
+                    fitted_model = copy(fitted_model)
+                    fitted_model.update(construct_features(time_range=(first_new_row, end_of_new_rows),
+                                                           specs=model_specs))
+            self.fitted_models.replace((target_variable, lag), lambda model_state: ModelState(
+                fitted_model, model_specs))
+
+    def get_cached_model(self, lag, target_variable):
+        """Return the cached fitted model of target_variable for this lag, or None (without fitting it)."""
+        model_state = self.fitted_models.peek((target_variable, lag))
+        return model_state.split()[0] if model_state is not None else None
+
+    @property
+    def data_version(self) -> int:
+        return self.series.version if self.series is not None else 0
+
+    @property
+    def temperature_series(self) -> pd.Series:
+        return self.series.temperature_series
+
+    @property
+    def irradiance_series(self) -> pd.Series:
+        return self.series.irradiance_series
+
+    @property
+    def wind_speed_series(self) -> pd.Series:
+        return self.series.wind_speed_series
+
+    @timed('get_model_specs')
+    def get_model_specs(self, lag=24, target_variable="temperature", series: SeriesSnapshot = None):
         """
         Generate specifications for the forecasting model, including setting up the outcome variable and regressors.
         """
+        if series is None:
+            series = self.series
 
         # Define the time range for training and testing data
-        start_of_training = self.temperature_series.index[0]  # First date in the temperature series
-        end_of_testing = self.temperature_series.index[-1]  # Last date in the temperature series
+        start_of_training = series.temperature_series.index[0]  # First date in the temperature series
+        end_of_testing = series.temperature_series.index[-1]  # Last date in the temperature series
 
         if target_variable == 'temperature':
-            outcome_var = copy(self.temperature_object_series)
-            regressors = [copy(self.irradiance_object_series), copy(self.wind_speed_object_series)]
+            outcome_var = copy(series.temperature_object_series)
+            regressors = [copy(series.irradiance_object_series), copy(series.wind_speed_object_series)]
         elif target_variable == 'irradiance':
-            outcome_var = copy(self.irradiance_object_series)
-            regressors = [copy(self.temperature_object_series), copy(self.wind_speed_object_series)]
+            outcome_var = copy(series.irradiance_object_series)
+            regressors = [copy(series.temperature_object_series), copy(series.wind_speed_object_series)]
         else:
-            outcome_var = copy(self.wind_speed_object_series)
-            regressors = [copy(self.temperature_object_series), copy(self.irradiance_object_series)]
+            outcome_var = copy(series.wind_speed_object_series)
+            regressors = [copy(series.temperature_object_series), copy(series.irradiance_object_series)]
 
         # todo : test on other regression models ( like VAR for Multivariate Forecasting from statsmodels.tsa.api)
         model_specs = speccing.ModelSpecs(
@@ -122,31 +305,67 @@ class WEATHER_FORECAST_MODEL():
             regressors=regressors,
             start_of_training=start_of_training + timedelta(hours=lag),
             end_of_testing=end_of_testing - timedelta(hours=lag),
-            ratio_training_testing_data=0.80,  # Train-test split ratio
+            ratio_training_testing_data=RATIO_TRAINING_TESTING_DATA,  # Train-test split ratio
         )
         return model_specs
 
+    def get_regression_frame(self, lag=24, target_variable="temperature") -> pd.DataFrame:
+        """
+        Outcome (first column) and lagged features of a lag's model over the whole modelled range,
+        training and testing periods together, indexed by outcome time.
+        """
+        model_specs = self.get_model_specs(lag=lag, target_variable=target_variable)
+        return construct_features(
+            time_range=(model_specs.start_of_training, model_specs.end_of_testing + model_specs.frequency),
+            specs=model_specs)
+
+    def get_model_state(self, lag=24, target_variable="temperature") -> ModelState:
+        """
+        Return the fitted model of target_variable for this lag together with its specs.
+        Models are fitted on the first request only and then served from the LRU model cache.
+        The fit uses the series snapshot current at call time, so a concurrent update_series cannot leak into it.
+        """
+        with self._series_lock:
+            series = self.series
+            generation = self.fitted_models.generation
+
+        def fit():
+            model_specs = self.get_model_specs(lag=lag, target_variable=target_variable, series=series)
+            if self.estimator == 'online':
+                fitted_model = OnlineRegressor.fit(construct_features(time_range="train", specs=model_specs))
+            else:
+                fitted_model = create_fitted_model(model_specs, f"Weather Forecast {target_variable} Model")
+            return ModelState(fitted_model, model_specs)
+
+        return self.fitted_models.get_or_create((target_variable, lag), fit, generation=generation)
+
+    @timed('train_models')
     def train_models(self, lag=24):
         """
         Train models for each target variable based on generated specifications.
+        Already fitted models are taken from the model cache.
+        Returns a read-only snapshot of this lag's models, so callers never see another lag's or request's models.
         """
-        for target_variable in target_variables:
-            model_specs = self.get_model_specs(lag=lag, target_variable=target_variable)
-            fitted_model = create_fitted_model(model_specs, f"Weather Forecast {target_variable} Model")
-            self.fitted_models[target_variable] = fitted_model
+        return MappingProxyType({target_variable: self.get_model_state(lag=lag, target_variable=target_variable)
+                                 for target_variable in target_variables})
+
+    def warm_up(self, lags=WARM_UP_LAGS):
+        """
+        Fit the models of every target variable for the given lags ahead of the first request.
+        """
+        for lag in lags:
+            self.train_models(lag)
 
     def evaluate_models(self, lag):
         """
         We transformed evaluate_models from timetomodel to get adequate output
         :return: rmse values for each model
         """
-        self.train_models(lag)
+        model_states = self.train_models(lag)
         rmse_values = {}
         percentage_accuracy = {}
         for target_variable in target_variables:
-            m1 = ModelState(self.fitted_models[target_variable], self.get_model_specs(lag=lag,
-                                                                                      target_variable=target_variable))
-            fitted_m1, m1_specs = m1.split()
+            fitted_m1, m1_specs = model_states[target_variable].split()
             regression_frame = construct_features(time_range="test", specs=m1_specs)
             x_test = regression_frame.iloc[:, 1:]
             y_test = np.array(regression_frame.iloc[:, 0])
@@ -168,19 +387,29 @@ class WEATHER_FORECAST_MODEL():
         """
         Generate a forecast for specified weather variables using trained models and current conditions.
         """
-        self.train_models(lag)
+        model_states = self.train_models(lag)
         features = pd.DataFrame(
             index=pd.date_range(start=now, end=now, freq="H"),
             data=calculation_mesures,
         ).iloc[0]
 
         forecasted_values = {}
-        for target_variable in target_variables:
-            model_specs = self.get_model_specs(lag, target_variable=target_variable)
-            forecasted_value = make_forecast_for(
-                specs=model_specs,
-                features=features,
-                model=self.fitted_models[target_variable]
-            )
-            forecasted_values[target_variable] = forecasted_value
+        with timed('forecast'):
+            for target_variable in target_variables:
+                fitted_model, model_specs = model_states[target_variable].split()
+                forecasted_value = make_forecast_for(
+                    specs=model_specs,
+                    features=features,
+                    model=fitted_model
+                )
+                forecasted_values[target_variable] = forecasted_value
         return forecasted_values
+
+    def get_lag_parameters(self, lag=24) -> np.ndarray:
+        """
+        Return this lag's fitted OLS coefficients as a (target variables x features) matrix.
+        make_forecast_for predicts with them positionally, so features @ parameters.T gives the same forecasts.
+        """
+        model_states = self.train_models(lag)
+        return np.vstack([np.asarray(model_states[target_variable].split()[0].params, dtype=float)
+                          for target_variable in target_variables])